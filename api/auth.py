@@ -1,9 +1,13 @@
+import hashlib
+import time
+import uuid
 from datetime import timedelta
 from typing import Annotated
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from db.database import get_db
 from models.models import User
+from core.cache import TTLCache
 from core.config import settings
 import jwt
 from fastapi.security import OAuth2PasswordBearer
@@ -13,6 +17,18 @@ from core.security import decode_access_token
 # Schéma OAuth2 pour gérer le token d'authentification
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/users/token")
 
+# Cache des tokens déjà vérifiés : sha256(token) -> (claims, instantané de l'utilisateur).
+# Chaque entrée expire à l'échéance `exp` du token, et au plus tard après USER_CACHE_TTL secondes :
+# l'invalidation étant propre au worker, une modification faite par un autre worker est prise en compte dans ce délai.
+_token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE, name="tokens")
+
+
+def invalidate_user_tokens(user_id: uuid.UUID):
+    """
+    Retire du cache tous les tokens vérifiés de l'utilisateur (à appeler après une modification ou une suppression).
+    """
+    _token_cache.discard_where(lambda entry: entry[1].id == user_id)
+
 
 def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> User:
     """
@@ -20,7 +36,13 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
     
     Cette fonction décode le JWT, extrait l'ID utilisateur et vérifie si l'utilisateur existe et est actif.
     Si le token est invalide ou expiré, elle lève une exception HTTP 403.
+    Un token déjà vérifié est servi depuis le cache, sans nouvelle vérification de signature ni requête.
     """
+    token_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    cached = _token_cache.get(token_key)
+    if cached is not None:
+        return cached[1]
+
     try:
         payload = decode_access_token(token)
         user_id = payload.get("sub")
@@ -31,15 +53,19 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
             )
         # Recherche l'utilisateur dans la base de données avec l'ID extrait du token
         user = db.get(User, user_id)
-        if not user:
+        if not user or user.deleted_at is not None:
             raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-        return user
     except (jwt.InvalidTokenError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Token invalide ou expiré",
         )
 
+    # Instantané détaché de la session (sans le hash du mot de passe)
+    snapshot = User(**user.model_dump(exclude={"password"}))
+    _token_cache.set(token_key, (payload, snapshot), expires_at=min(payload["exp"], time.time() + settings.USER_CACHE_TTL))
+    return snapshot
+
 
 # Alias pour l'utilisateur courant afin de l'utiliser facilement dans les dépendances FastAPI
 CurrentUser = Annotated[User, Depends(get_current_user)]
@@ -1,22 +1,28 @@
+import asyncio
 import os
 import uuid
+import zipfile
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from db.database import get_db
-from models.models import Product
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db.database import get_async_db, get_db, get_read_db
+from models.models import CertificateBatchRequest, CertificateJobResponse, Product, User
+from crud.crud_job import create_certificate_job, get_job_by_id
 from crud.crud_user import get_user_by_id
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.pdfgen import canvas
-from io import BytesIO
+from core.certificate import CertificateFields, get_render_pool, render_certificate_files, render_certificates
+from core.config import settings
 from datetime import datetime
-from math import cos, sin, radians
 
 router = APIRouter()
 
-@router.post("/generate_pdf/")
-def generate_pdf(mairie_id: uuid.UUID, association_id: uuid.UUID, product_reference: str, db: Session = Depends(get_db)):
+@router.post("/generate_pdf/", status_code=202)
+def generate_pdf(mairie_id: uuid.UUID, association_id: uuid.UUID, product_reference: str, db: Session = Depends(get_db)) -> CertificateJobResponse:
+    """
+    Met en file la génération du certificat d'un produit et retourne immédiatement le job créé.
+    L'avancement se suit avec `GET /format/jobs/{job_id}` ; le PDF est ensuite servi par `get_pdf`.
+    """
     mairie_user = get_user_by_id(db, mairie_id)
     association_user = get_user_by_id(db, association_id)
     product = db.query(Product).filter(Product.reference == product_reference).first()
@@ -28,107 +34,120 @@ def generate_pdf(mairie_id: uuid.UUID, association_id: uuid.UUID, product_refere
     if not product:
         raise HTTPException(status_code=404, detail="Produit non trouvé.")
 
-    pdf_path = f"./uploads/pdf/{product.reference}.pdf"
-    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
-
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-
-    # Header: centered title
-    c.setFont("Helvetica-Bold", 18)
-    c.drawCentredString(300, 750, "Certificat de Formatage d'Ordinateur")
-
-    # Sub-header
-    c.setFont("Helvetica", 12)
-    c.drawCentredString(300, 730, f"Délivré par la Mairie de {mairie_user.nom}")
-
-    # Body content
-    c.setFont("Helvetica", 11)
-    text_lines = [
-        f"Référence du produit : {product.reference}",
-        f"Association bénéficiaire : {association_user.nom} {association_user.prenom}",
-        "",
-        "Ce document atteste que l'ordinateur mentionné ci-dessus a été entièrement formaté. ",
-        "Toutes les données personnelles ont été supprimées conformément aux normes en vigueur, ",
-        "",
-        "Le processus de formatage inclut les étapes suivantes :",
-        "- Analyse initiale pour vérifier l'état du disque et identifier toutes les partitions existantes.",
-        "- Suppression complète des partitions et des données associées.",
-        "- Réinstallation d'un système d'exploitation propre et exempt de toute donnée résiduelle.",
-        "- Configuration minimale pour permettre un usage immédiat par les nouveaux bénéficiaires.",
-        "",
-        "L'objectif de cette opération est double :",
-        "1. Assurer la confidentialité des données de l'ancien propriétaire.",
-        "2. Préparer l'appareil pour qu'il soit pleinement opérationnel pour de nouveaux usages.",
-        "",
-        "Nous tenons à vous remercier chaleureusement pour votre générosité. Grâce à votre contribution,",
-        "vous participez activement à une démarche solidaire et responsable, en réduisant les déchets électroniques ",
-        "et en favorisant l'accès au numérique pour tous.",
-        "",
-        "Ce certificat est signé par la mairie et garantit que toutes les procédures ont été suivies.",
-    ]
+    return create_certificate_job(db, mairie_user.id, association_user.id, product.reference)
+
 
-    y = 670
-    for line in text_lines:
-        c.drawString(60, y, line)
-        y -= 20
-
-    # Signature section
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(100, y - 30, f"Signé par la Mairie de {mairie_user.nom}")
-
-    c.setLineWidth(1)
-    c.setStrokeColor(colors.darkblue)
-    c.line(100, y - 40, 300, y - 40)
-
-    # Footer: Date and circular text
-    c.setFont("Helvetica", 10)
-    c.drawString(100, 50, f"Date : {datetime.now().strftime('%d-%m-%Y')}")
-    c.drawRightString(500, 50, "Page 1/1")
-
-    # Circular logo or text
-    texte_cercle = "Liberté, égalité, fraternité,"
-    radius = 65
-    angle_step = 360 / len(texte_cercle.replace(" ", ""))
-    current_angle = 0
-
-    for char in texte_cercle.replace(" ", ""):
-        x = 450 + radius * cos(radians(current_angle))
-        y = 150 + radius * sin(radians(current_angle))
-        c.saveState()
-        c.translate(x, y)
-        c.rotate(current_angle + 90)
-        c.setFont("Helvetica", 8)
-        c.drawString(-3, 0, char)
-        c.restoreState()
-        current_angle += angle_step
-
-    text_maire_de = "Maire de"
-    text_nom_mairie = f"{mairie_user.nom}"
-    text_maire_de_width = c.stringWidth(text_maire_de, "Helvetica-Bold", 10)
-    text_nom_mairie_width = c.stringWidth(text_nom_mairie, "Helvetica-Bold", 10)
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(450 - text_maire_de_width / 2, 140, text_maire_de)
-    c.drawString(450 - text_nom_mairie_width / 2, 125, text_nom_mairie)
-
-    c.save()
-
-    with open(pdf_path, "wb") as f:
-        f.write(buffer.getvalue())
-
-    return {"message": "PDF généré avec succès", "file_path": pdf_path}
+@router.get("/jobs/{job_id}")
+def get_pdf_job(job_id: uuid.UUID, db: Session = Depends(get_db)) -> CertificateJobResponse:
+    """Retourne l'état d'avancement d'un job de génération de certificat."""
+    job = get_job_by_id(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trouvé.")
+    return job
 
 
 @router.get("/get_pdf/{product_reference}")
-def get_pdf(product_reference: str, db: Session = Depends(get_db)):
+def get_pdf(product_reference: str, db: Session = Depends(get_read_db)):
     product = db.query(Product).filter(Product.reference == product_reference).first()
 
     if not product:
         raise HTTPException(status_code=404, detail="Produit non trouvé.")
     
-    pdf_path = f"./uploads/pdf/{product_reference}.pdf"
+    pdf_path = os.path.join(settings.CERTIFICATE_DIR, f"{product_reference}.pdf")
 
     if not os.path.exists(pdf_path):
         raise HTTPException(status_code=404, detail="PDF non trouvé.")
 
     return FileResponse(pdf_path)
+
+
+class _ZipSink:
+    """Flux d'écriture non positionnable : zipfile y écrit l'archive au fil de l'eau."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _stream_certificates_zip(certificates: list[CertificateFields]):
+    """Rend les certificats par paquets dans le pool de processus et les ajoute à l'archive dès qu'ils arrivent."""
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    chunk_size = -(-len(certificates) // settings.CERTIFICATE_WORKERS)
+    futures = [
+        loop.run_in_executor(pool, render_certificate_files, certificates[i:i + chunk_size])
+        for i in range(0, len(certificates), chunk_size)
+    ]
+
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for future in asyncio.as_completed(futures):
+            for reference, pdf in await future:
+                archive.writestr(f"{reference}.pdf", pdf)
+            yield sink.drain()
+    yield sink.drain()
+
+
+@router.post("/generate_pdf/batch")
+async def generate_pdf_batch(batch: CertificateBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Génère en une fois les certificats de tous les produits d'une mairie (ou d'une liste de références).
+    Les produits et utilisateurs sont chargés en une seule requête puis rendus en parallèle
+    dans un pool de processus. Retourne un PDF multi-pages (`output=pdf`) ou une archive ZIP streamée.
+    """
+    if batch.mairie_id is None and not batch.product_references:
+        raise HTTPException(status_code=422, detail="Indiquer une mairie ou une liste de références produit.")
+
+    mairie = aliased(User)
+    association = aliased(User)
+    query = (
+        select(Product.reference, mairie.nom, association.nom, association.prenom)
+        .join(mairie, Product.mairie_user_id == mairie.id)
+        .join(association, Product.association_user_id == association.id)
+        .order_by(Product.reference)
+    )
+    if batch.mairie_id is not None:
+        query = query.where(Product.mairie_user_id == batch.mairie_id)
+    if batch.product_references:
+        query = query.where(Product.reference.in_(batch.product_references))
+
+    rows = (await db.execute(query)).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Aucun produit associé à une association trouvé.")
+
+    date = datetime.now().strftime('%d-%m-%Y')
+    certificates = [
+        CertificateFields(
+            mairie_nom=mairie_nom,
+            association_nom=association_nom,
+            association_prenom=association_prenom,
+            product_reference=reference,
+            date=date,
+        )
+        for reference, mairie_nom, association_nom, association_prenom in rows
+    ]
+
+    if batch.output == "pdf":
+        pdf = await asyncio.get_running_loop().run_in_executor(get_render_pool(), render_certificates, certificates)
+        return Response(
+            pdf,
+            media_type="application/pdf",
+            headers={"Content-Disposition": 'attachment; filename="certificats.pdf"'},
+        )
+
+    return StreamingResponse(
+        _stream_certificates_zip(certificates),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="certificats.zip"'},
+    )
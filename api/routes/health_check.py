@@ -1,10 +1,20 @@
 from datetime import datetime
 from fastapi import APIRouter
 
+from core.cache import cache_stats
+from core.metrics import latency_stats
+
 router = APIRouter()
 @router.get('/')
 def read_healthcheck():
     return {
         "status": "alive",
         "at": f'{datetime.now()}'
-    }
\ No newline at end of file
+    }
+
+@router.get('/metrics')
+def read_metrics():
+    return {
+        "caches": cache_stats(),
+        "latencies": latency_stats(),
+    }
@@ -1,151 +1,453 @@
+import asyncio
 import os
-from typing import List
+from functools import partial
+from typing import List, Literal, Optional
 import uuid
 import datetime
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from minio import Minio
+from minio.error import S3Error
+from sqlalchemy import Select, select, tuple_
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
-from db.database import get_db
-from models.models import Product, ProductCreate, ProductResponse, ProductUpdate, ProductUpdateStatus, ProductUpdatesAssociation
-from crud.crud_user import get_user_by_id
-from crud.crud_product import get_product_by_id
-from models.status import Status
-import json
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db.database import get_async_db, get_db, get_engine, get_read_db
+from models.models import MairieStatusStats, Product, ProductBatchAssociationUpdate, ProductBatchStatusUpdate, ProductBatchUpdateResult, ProductBulkCreate, ProductBulkError, ProductBulkResult, ProductCreate, ProductExpand, ProductExpandedResponse, ProductPhotosAttach, ProductResponse, ProductUpdate, ProductUpdateStatus, ProductUpdatesAssociation
+from crud.crud_user import get_existing_user_ids_async, get_user_by_id, get_user_by_id_async
+from crud.crud_product import adjust_status_count, adjust_status_count_async, create_products_async, new_product_reference, get_expanded_users_updated_at, get_mairie_status_stats, get_product_by_id, get_product_by_id_async, get_product_updated_at, get_products_fingerprint, product_exists_async, iter_mairie_product_batches, mark_photo_derivatives, product_export_columns, product_load_options, search_products, update_products_association_async, update_products_status_async
+from models.status import Status, previous_status
+from core.conditional import collection_headers, is_not_modified, not_modified, resource_headers
+from core.events import format_sse, notify_product_events, notify_product_events_async, product_event, product_events
+from core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from core.streaming import CSV_MEDIA_TYPE, NDJSON_MEDIA_TYPE, csv_chunk, csv_header, ndjson_rows_chunk
+from core.config import settings
+from core.images import schedule_derivatives
+from api.routes.qr import evict_qr_codes
+from core.photos import object_name_from_url, public_url
+from core.storage import PHOTO_CONTENT_TYPE_PREFIX, PRESIGNED_PREFIX, get_storage_client
 
 router = APIRouter()
 
+# Formats de l'export des produits d'une mairie
+ProductExportFormat = Literal["csv", "ndjson"]
+EXPORT_MEDIA_TYPES = {"csv": CSV_MEDIA_TYPE, "ndjson": NDJSON_MEDIA_TYPE}
+
+
+def _representation_variant(db: Session, request: Request, expand: List[str], products: Select) -> str:
+    """
+    Partie de l'ETag propre à la représentation : paramètres de requête et, si des utilisateurs
+    sont intégrés, leur dernière modification (seulement ceux des produits sélectionnés par `products`).
+    """
+    variant = str(request.url.query)
+    if expand:
+        variant += f"|{get_expanded_users_updated_at(db, products, expand)}"
+    return variant
+
+
+def _record_photo_derivatives(engine: Engine, photo_url: str):
+    with Session(engine) as db:
+        mark_photo_derivatives(db, photo_url)
+
+
+def _schedule_photo_derivatives(client: Minio, engine: Engine, photo_urls: List[str]):
+    """
+    Planifie la génération des variantes des photos de notre bucket. Une fois générées, elles sont
+    enregistrées sur les produits qui utilisent la photo, et seulement alors annoncées dans les réponses.
+    """
+    for photo_url in dict.fromkeys(photo_urls):
+        object_name = object_name_from_url(photo_url)
+        if object_name is not None:
+            schedule_derivatives(
+                client, settings.S3_BUCKET, object_name,
+                on_generated=partial(_record_photo_derivatives, engine, photo_url),
+            )
+
+
 @router.post("/", status_code=201)
 async def create_new_product(
     product: ProductCreate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    client: Minio = Depends(get_storage_client),
+    engine: Engine = Depends(get_engine),
 ):
     """Crée un nouveau produit avec des images associées."""
 
-    current_date = datetime.datetime.now().strftime("%Y%m%d")
-    random_part = str(uuid.uuid4()).split("-")[0]
-    reference = f"PRD-{current_date}-{random_part}"
+    reference = new_product_reference()
 
-    user = get_user_by_id(db, product.user_id) if product.user_id else None
-    mairie_user = get_user_by_id(db, product.mairie_user_id)
+    user = await get_user_by_id_async(db, product.user_id) if product.user_id else None
+    mairie_user = await get_user_by_id_async(db, product.mairie_user_id)
     if mairie_user is None:
         raise HTTPException(status_code=404, detail="Mairie utilisateur non trouvé.")
 
     product_data = product.dict(exclude={'user_id', 'mairie_user_id'})
-    product_data["photos"] = json.dumps(product_data["photos"])
+    product_data["photos"] = product_data["photos"] or []
     product_db = Product(**product_data, reference=reference, user_id=user.id if user else None, mairie_user_id=mairie_user.id)
     try:
         db.add(product_db)
-        db.commit();
+        await adjust_status_count_async(db, product_db.mairie_user_id, None, product_db.status, 1)
+        await notify_product_events_async(db, [product_event("created", product_db)])
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création du produit : {str(e)}")
 
+    _schedule_photo_derivatives(client, engine, product_db.photos)
     return {"product": product_db}
 
+@router.post("/bulk", status_code=201)
+async def create_products_bulk(
+    bulk: ProductBulkCreate,
+    db: AsyncSession = Depends(get_async_db),
+    client: Minio = Depends(get_storage_client),
+    engine: Engine = Depends(get_engine),
+) -> ProductBulkResult:
+    """
+    Crée plusieurs produits en une seule transaction.
+    Chaque élément est validé séparément (schéma de `ProductCreate`, existence des utilisateurs) : les éléments
+    invalides sont signalés par leur index dans `errors`, les autres sont insérés en une seule requête.
+    Si aucun élément n'est valide, la réponse est une 422 listant les erreurs.
+    """
+    errors: list[ProductBulkError] = []
+    candidates: list[tuple[int, ProductCreate]] = []
+    for index, item in enumerate(bulk.products):
+        if isinstance(item, ProductCreate):
+            candidates.append((index, item))
+        elif not isinstance(item, dict):
+            errors.append(ProductBulkError(index=index, detail="L'élément doit être un objet."))
+        else:
+            # Élément invalide, conservé tel quel par le modèle : validé à nouveau pour en détailler les erreurs
+            try:
+                ProductCreate.model_validate(item)
+            except ValidationError as e:
+                errors.append(ProductBulkError(index=index, detail=e.errors(include_url=False, include_context=False)))
+
+    # Tous les utilisateurs référencés sont vérifiés en une seule requête
+    referenced_ids = {product.mairie_user_id for _, product in candidates}
+    referenced_ids |= {product.user_id for _, product in candidates if product.user_id}
+    existing_ids = await get_existing_user_ids_async(db, referenced_ids)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rows = []
+    for index, product in candidates:
+        if product.mairie_user_id not in existing_ids:
+            errors.append(ProductBulkError(index=index, detail="Mairie utilisateur non trouvé."))
+            continue
+        if product.user_id and product.user_id not in existing_ids:
+            errors.append(ProductBulkError(index=index, detail="Utilisateur non trouvé."))
+            continue
+        rows.append({
+            **product.model_dump(exclude={"photos"}),
+            "id": uuid.uuid4(),
+            "reference": new_product_reference(),
+            "photos": product.photos or [],
+            "association_user_id": None,
+            "created_at": now,
+            "updated_at": now,
+        })
+    errors.sort(key=lambda error: error.index)
+
+    if not rows:
+        return JSONResponse(status_code=422, content={"detail": [error.model_dump(mode="json") for error in errors]})
+
+    try:
+        await create_products_async(db, rows)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la création des produits : {str(e)}")
+
+    _schedule_photo_derivatives(client, engine, [photo for row in rows for photo in row["photos"]])
+    return ProductBulkResult(created=rows, errors=errors)
+
 @router.get("/")
-def get_all_products(db: Session = Depends(get_db), skip: int = 0, limit: int = 10) -> list[ProductResponse]:
-    """Retourne tous les produits avec leurs images associées."""
-    
-    products = db.query(Product).offset(skip).limit(limit).all()
-    
-    product_responses = []
-    for product in products:
-        product_response = ProductResponse(
-            id=product.id,
-            title=product.title,
-            description=product.description,
-            reference=product.reference,
-            photos=json.loads(product.photos)
-        )
-        product_responses.append(product_response)
+def get_all_products(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=settings.PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    expand: List[ProductExpand] = Query(default=[]),
+) -> list[ProductExpandedResponse]:
+    """
+    Retourne tous les produits avec leurs images associées, triés par (created_at, id).
+
+    Si `cursor` est fourni, la page commence juste après la position qu'il encode
+    (pagination par curseur, `skip` est alors ignoré) ; sinon `skip`/`limit` s'appliquent.
+    Lorsqu'une page est pleine, le curseur de la page suivante est renvoyé dans l'en-tête `X-Next-Cursor`.
+    `expand` (répétable : user, mairie_user, association_user) intègre les utilisateurs liés à chaque produit.
+    La liste porte un ETag : une requête conditionnelle sur une liste inchangée reçoit un 304.
+    """
+    page = select(Product).order_by(Product.created_at, Product.id)
+    if cursor is not None:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        page = page.where(tuple_(Product.created_at, Product.id) > tuple_(cursor_created_at, cursor_id))
+    else:
+        page = page.offset(skip)
+    page = page.limit(limit)
+
+    headers = collection_headers(*get_products_fingerprint(db), _representation_variant(db, request, expand, page))
+    if is_not_modified(request, headers):
+        return not_modified(headers)
+    response.headers.update(headers)
+
+    products = db.scalars(page.options(*product_load_options(expand))).all()
+    if products and len(products) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(products[-1].created_at, products[-1].id)
     
-    return product_responses
+    return [ProductExpandedResponse.from_product(product, expand) for product in products]
+
+@router.get("/events")
+async def product_events_feed(
+    request: Request,
+    mairie_id: Optional[uuid.UUID] = None,
+    association_id: Optional[uuid.UUID] = None,
+):
+    """
+    Flux SSE (`text/event-stream`) des évènements des produits d'une mairie et/ou d'une association :
+    created, status, association, deleted. Remplace l'interrogation périodique des listes.
+    Si le client ne consomme pas assez vite, le flux est fermé : il doit se reconnecter puis recharger la liste.
+    """
+    if mairie_id is None and association_id is None:
+        raise HTTPException(status_code=422, detail="Indiquer une mairie ou une association.")
+
+    return StreamingResponse(
+        _stream_product_events(request, mairie_id, association_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _stream_product_events(request: Request, mairie_id: Optional[uuid.UUID], association_id: Optional[uuid.UUID]):
+    with product_events.subscribe(mairie_id, association_id) as subscription:
+        while not (subscription.overflowed and subscription.queue.empty()):
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=settings.EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                # Commentaire SSE : maintient la connexion ouverte à travers les proxys
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+
+@router.get("/search")
+def search_all_products(
+    q: str = Query(min_length=1, max_length=255),
+    db: Session = Depends(get_read_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=settings.PAGE_MAX_SIZE),
+    expand: List[ProductExpand] = Query(default=[]),
+) -> list[ProductExpandedResponse]:
+    """
+    Recherche plein texte (titre, marque, description, panne) et tolérante aux fautes de frappe
+    (marque, référence). Les produits sont triés par pertinence.
+    """
+    products = search_products(db, q, skip=skip, limit=limit, expand=expand)
+    return [ProductExpandedResponse.from_product(product, expand) for product in products]
 
 @router.get("/{product_id}")
-def get_product(product_id: uuid.UUID, db: Session = Depends(get_db)) -> ProductResponse:
-    """Retourne un produit avec ses images associées."""
-    
-    product = get_product_by_id(db, product_id)
+def get_product(
+    product_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    expand: List[ProductExpand] = Query(default=[]),
+) -> ProductExpandedResponse:
+    """
+    Retourne un produit avec ses images associées et, selon `expand`, ses utilisateurs liés.
+    Le produit porte un ETag et un Last-Modified dérivés de `updated_at` : une requête conditionnelle
+    sur un produit inchangé reçoit un 304, décidé sans charger le produit.
+    """
+    variant = _representation_variant(db, request, expand, select(Product).where(Product.id == product_id))
+    updated_at = get_product_updated_at(db, product_id)
+    if updated_at is None:
+        raise HTTPException(status_code=404, detail="Produit non trouvé.")
+    headers = resource_headers(updated_at, variant)
+    if is_not_modified(request, headers):
+        return not_modified(headers)
+
+    product = get_product_by_id(db, product_id, expand=expand)
     if product is None:
         raise HTTPException(status_code=404, detail="Produit non trouvé.")
+    response.headers.update(resource_headers(product.updated_at, variant))
     
-    product_response = ProductResponse(
-            id=product.id,
-            title=product.title,
-            description=product.description,
-            reference=product.reference,
-            photos=json.loads(product.photos)
-        )
-    
-    return product_response
+    return ProductExpandedResponse.from_product(product, expand)
   
 @router.get("/user/{user_id}")
-def get_product_by_user_id(user_id: uuid.UUID, db: Session = Depends(get_db)) -> list[ProductResponse]:
+def get_product_by_user_id(
+    user_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    expand: List[ProductExpand] = Query(default=[]),
+) -> list[ProductExpandedResponse]:
     """Retourne les produits du user avec leurs images associées."""
     user = get_user_by_id(db, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé.")
+
+    criteria = Product.user_id == user.id
+    headers = collection_headers(
+        *get_products_fingerprint(db, criteria),
+        _representation_variant(db, request, expand, select(Product).where(criteria)),
+    )
+    if is_not_modified(request, headers):
+        return not_modified(headers)
+    response.headers.update(headers)
     
-    products = db.query(Product).filter(Product.user_id == user.id).all()
-    
-    product_responses = []
-    for product in products:
-        product_response = ProductResponse(
-            id=product.id,
-            title=product.title,
-            description=product.description,
-            reference=product.reference,
-            photos=json.loads(product.photos)
-        )
-        product_responses.append(product_response)
+    products = (
+        db.query(Product)
+        .options(*product_load_options(expand))
+        .filter(criteria)
+        .all()
+    )
     
-    return product_responses
+    return [ProductExpandedResponse.from_product(product, expand) for product in products]
+
+@router.put("/batch/status")
+async def update_products_status(batch: ProductBatchStatusUpdate, db: AsyncSession = Depends(get_async_db)) -> ProductBatchUpdateResult:
+    """
+    Fait avancer plusieurs produits au status demandé, en une seule requête.
+    Seuls les produits à l'étape précédente du cycle de vie sont modifiés ; les autres sont listés dans `skipped`.
+    """
+    from_status = previous_status(batch.status)
+    if from_status is None:
+        raise HTTPException(status_code=422, detail=f"Le status « {batch.status.value} » est le status initial d'un produit.")
+
+    products = await update_products_status_async(db, set(batch.ids), batch.status, from_status)
+    await db.commit()
+
+    updated_ids = {product.id for product in products}
+    return ProductBatchUpdateResult(
+        updated=products,
+        skipped=[product_id for product_id in dict.fromkeys(batch.ids) if product_id not in updated_ids],
+    )
+
+@router.put("/batch/association")
+async def update_products_association(batch: ProductBatchAssociationUpdate, db: AsyncSession = Depends(get_async_db)) -> ProductBatchUpdateResult:
+    """
+    Attribue une association à plusieurs produits, en une seule requête.
+    Les produits inconnus ou déjà attribués à cette association sont listés dans `skipped`.
+    """
+    asso = await get_user_by_id_async(db, batch.association_user_id)
+    if asso is None:
+        raise HTTPException(status_code=404, detail="Association non trouvée.")
+
+    products = await update_products_association_async(db, set(batch.ids), asso.id)
+    await db.commit()
+
+    updated_ids = {product.id for product in products}
+    return ProductBatchUpdateResult(
+        updated=products,
+        skipped=[product_id for product_id in dict.fromkeys(batch.ids) if product_id not in updated_ids],
+    )
 
 @router.put("/{product_id}/status")
-async def update_product_status(product: ProductUpdateStatus, db: Session = Depends(get_db)) -> ProductResponse:
+async def update_product_status(product: ProductUpdateStatus, db: AsyncSession = Depends(get_async_db)) -> ProductResponse:
     """Met à jour uniquement le status d'un produit."""
     
-    product_db = get_product_by_id(db, product.id)
+    product_db = await get_product_by_id_async(db, product.id, for_update=True)
     if product_db is None:
         raise HTTPException(status_code=404, detail="Produit non trouvé.")
     
-    product_db.status = product.status
+    if product.status != product_db.status:
+        await adjust_status_count_async(db, product_db.mairie_user_id, product_db.association_user_id, product_db.status, -1)
+        await adjust_status_count_async(db, product_db.mairie_user_id, product_db.association_user_id, product.status, 1)
+        product_db.status = product.status
+        await notify_product_events_async(db, [product_event("status", product_db)])
     product_db.updated_at = datetime.datetime.now(datetime.timezone.utc)
     
-    db.commit()
-    db.refresh(product_db)
+    await db.commit()
+    await db.refresh(product_db)
     
     return product_db
 
 @router.put("/{product_id}/association")
-async def update_product_association(product: ProductUpdatesAssociation, db: Session = Depends(get_db)) -> ProductResponse :
+async def update_product_association(product: ProductUpdatesAssociation, db: AsyncSession = Depends(get_async_db)) -> ProductResponse :
     """Met à jour l'association d'un produit."""
     
-    product_db = get_product_by_id(db, product.id)
+    product_db = await get_product_by_id_async(db, product.id, for_update=True)
     if product_db is None:
         raise HTTPException(status_code=404, detail="Produit non trouvé.")
 
-    asso = get_user_by_id(db, product.association_user_id)
+    asso = await get_user_by_id_async(db, product.association_user_id)
     if asso is None:
       raise HTTPException(status_code=404, detail="Association non trouvée.")
     
-    product_db.association_user_id = asso.id
+    previous_association_user_id = product_db.association_user_id
+    if asso.id != previous_association_user_id:
+        await adjust_status_count_async(db, product_db.mairie_user_id, previous_association_user_id, product_db.status, -1)
+        await adjust_status_count_async(db, product_db.mairie_user_id, asso.id, product_db.status, 1)
+        product_db.association_user_id = asso.id
+        await notify_product_events_async(db, [product_event("association", product_db, previous_association_user_id)])
     product_db.updated_at = datetime.datetime.now(datetime.timezone.utc)
     
-    db.commit()
-    db.refresh(product_db)
+    await db.commit()
+    await db.refresh(product_db)
     
     return product_db
   
+@router.post("/{product_id}/photos")
+async def attach_product_photos(
+    product_id: uuid.UUID,
+    photos: ProductPhotosAttach,
+    db: AsyncSession = Depends(get_async_db),
+    client: Minio = Depends(get_storage_client),
+    engine: Engine = Depends(get_engine),
+) -> ProductResponse:
+    """
+    Rattache au produit les photos envoyées directement au stockage via une URL présignée.
+    Chaque clé doit provenir de `POST /upload/presign` ; l'objet doit exister dans le bucket et respecter la taille et le type autorisés.
+    """
+    if not await product_exists_async(db, product_id):
+        raise HTTPException(status_code=404, detail="Produit non trouvé.")
+
+    for object_key in photos.object_keys:
+        if not object_key.startswith(PRESIGNED_PREFIX):
+            raise HTTPException(status_code=400, detail=f"Clé d'objet invalide : {object_key}")
+        try:
+            stat = await run_in_threadpool(client.stat_object, settings.S3_BUCKET, object_key)
+        except S3Error:
+            raise HTTPException(status_code=400, detail=f"Objet non trouvé dans le stockage : {object_key}")
+        # Mêmes limites que l'envoi via l'API, au cas où l'objet aurait été déposé autrement
+        if stat.size > settings.UPLOAD_MAX_SIZE:
+            raise HTTPException(status_code=400, detail=f"Fichier trop volumineux : {object_key}")
+        if not (stat.content_type or "").startswith(PHOTO_CONTENT_TYPE_PREFIX):
+            raise HTTPException(status_code=400, detail=f"Type de fichier non autorisé : {object_key}")
+
+    new_urls = [public_url(object_key) for object_key in photos.object_keys]
+    # Ligne verrouillée après les appels au stockage, le temps de la lecture-modification de la liste :
+    # deux rattachements simultanés ne peuvent pas s'écraser
+    product_db = await get_product_by_id_async(db, product_id, for_update=True)
+    if product_db is None:
+        raise HTTPException(status_code=404, detail="Produit non trouvé.")
+    # Nouvelle liste : la colonne JSONB n'est pas suivie en mutation
+    product_db.photos = product_db.photos + [url for url in new_urls if url not in product_db.photos]
+    product_db.updated_at = datetime.datetime.now(datetime.timezone.utc)
+
+    await db.commit()
+    await db.refresh(product_db)
+
+    _schedule_photo_derivatives(client, engine, new_urls)
+
+    return product_db
+
 @router.delete("/{product_id}")
 def delete_product(product_id: uuid.UUID, db: Session = Depends(get_db)):
     """Supprime un produit avec ses images associées."""
     
-    product = get_product_by_id(db, product_id)
+    product = get_product_by_id(db, product_id, for_update=True)
     if product is None:
         raise HTTPException(status_code=404, detail="Produit non trouvé.")
     
+    adjust_status_count(db, product.mairie_user_id, product.association_user_id, product.status, -1)
+    notify_product_events(db, [product_event("deleted", product)])
     db.delete(product)
     db.commit()
+    evict_qr_codes(product_id)
     
     return {"message": "Produit supprimé avec succès."}
   
@@ -166,45 +468,103 @@ def update_product_deposed_at(product_id: uuid.UUID, db: Session = Depends(get_d
     return product
 
 @router.get("/mairie/{mairie_id}")
-def get_product_by_mairie_id(mairie_id: uuid.UUID, db: Session = Depends(get_db)) -> list[ProductResponse] :
+def get_product_by_mairie_id(
+    mairie_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    expand: List[ProductExpand] = Query(default=[]),
+) -> list[ProductExpandedResponse]:
     """Retourne les produits de la mairie"""
     mairie = get_user_by_id(db, mairie_id)
     if mairie is None:
         raise HTTPException(status_code=404, detail="Mairie non trouvée.")
+
+    criteria = Product.mairie_user_id == mairie.id
+    headers = collection_headers(
+        *get_products_fingerprint(db, criteria),
+        _representation_variant(db, request, expand, select(Product).where(criteria)),
+    )
+    if is_not_modified(request, headers):
+        return not_modified(headers)
+    response.headers.update(headers)
     
-    products = db.query(Product).filter(Product.mairie_user_id == mairie.id).all()
-    
-    product_responses = []
-    for product in products:
-        product_response = ProductResponse(
-            id=product.id,
-            title=product.title,
-            description=product.description,
-            reference=product.reference,
-            photos=json.loads(product.photos)
-        )
-        product_responses.append(product_response)
+    products = (
+        db.query(Product)
+        .options(*product_load_options(expand))
+        .filter(criteria)
+        .all()
+    )
     
-    return product_responses
+    return [ProductExpandedResponse.from_product(product, expand) for product in products]
+
+@router.get("/mairie/{mairie_id}/export")
+def export_mairie_products(
+    mairie_id: uuid.UUID,
+    db: Session = Depends(get_read_db),
+    format: ProductExportFormat = "csv",
+    with_names: bool = False,
+):
+    """
+    Exporte tous les produits de la mairie (toutes les colonnes) en CSV ou en NDJSON, streamé au fil
+    de la lecture d'un curseur côté serveur. Avec `with_names`, les noms de l'association et du donateur sont ajoutés.
+    """
+    mairie = get_user_by_id(db, mairie_id)
+    if mairie is None:
+        raise HTTPException(status_code=404, detail="Mairie non trouvée.")
+
+    return StreamingResponse(
+        _stream_product_export(db.get_bind(), mairie.id, format, with_names),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="produits-{mairie.id}.{format}"'},
+    )
+
+def _stream_product_export(bind, mairie_id: uuid.UUID, format: str, with_names: bool):
+    columns = product_export_columns(with_names)
+    if format == "csv":
+        # L'en-tête part avant même l'exécution de la requête
+        yield csv_header(columns)
+    # Session propre au flux : celle de la dépendance est fermée avant la fin de l'envoi de la réponse
+    with Session(bind) as session:
+        for rows in iter_mairie_product_batches(session, mairie_id, with_names):
+            yield csv_chunk(rows, columns) if format == "csv" else ndjson_rows_chunk(rows)
+
+@router.get("/mairie/{mairie_id}/stats")
+def get_mairie_stats(mairie_id: uuid.UUID, db: Session = Depends(get_read_db)) -> MairieStatusStats:
+    """Retourne le nombre de produits de la mairie par status, au total et par association."""
+    mairie = get_user_by_id(db, mairie_id)
+    if mairie is None:
+        raise HTTPException(status_code=404, detail="Mairie non trouvée.")
+
+    return get_mairie_status_stats(db, mairie.id)
 
 @router.get("/association/{association_id}")
-def get_product_by_association_id(association_id: uuid.UUID, db: Session = Depends(get_db)) -> list[ProductResponse]:
+def get_product_by_association_id(
+    association_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    expand: List[ProductExpand] = Query(default=[]),
+) -> list[ProductExpandedResponse]:
     """Retourne les produits de l'association avec leurs images associées."""
     association = get_user_by_id(db, association_id)
     if association is None:
         raise HTTPException(status_code=404, detail="Association non trouvée.")
+
+    criteria = Product.association_user_id == association.id
+    headers = collection_headers(
+        *get_products_fingerprint(db, criteria),
+        _representation_variant(db, request, expand, select(Product).where(criteria)),
+    )
+    if is_not_modified(request, headers):
+        return not_modified(headers)
+    response.headers.update(headers)
     
-    products = db.query(Product).filter(Product.association_user_id == association.id).all()
-    
-    product_responses = []
-    for product in products:
-        product_response = ProductResponse(
-            id=product.id,
-            title=product.title,
-            description=product.description,
-            reference=product.reference,
-            photos=json.loads(product.photos)
-        )
-        product_responses.append(product_response)
+    products = (
+        db.query(Product)
+        .options(*product_load_options(expand))
+        .filter(criteria)
+        .all()
+    )
     
-    return product_responses
+    return [ProductExpandedResponse.from_product(product, expand) for product in products]
@@ -1,36 +1,134 @@
+import hashlib
+import os
 import qrcode
+import qrcode.image.svg
 from io import BytesIO
-from fastapi.responses import StreamingResponse
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from db.database import get_db
-from models.models import Product
-from crud.crud_product import get_product_by_id
+from typing import Literal, Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlmodel.ext.asyncio.session import AsyncSession
+from core.cache import TTLCache
+from core.conditional import etag_matches
+from core.config import settings
+from db.database import get_async_db
+from crud.crud_product import product_exists_async
 import uuid
 
 router = APIRouter()
 
-@router.get("/{product_id}/generate-qr-code")
-async def generate_qr_code(product_id: uuid.UUID, db: Session = Depends(get_db)):
-    """Génère un QR code pour un produit."""
-    product = get_product_by_id(db, product_id)
-    if product is None:
-        raise HTTPException(status_code=404, detail="Produit non trouvé.")
-    
-    product_url = f"http://localhost:8000/products/{product_id}"
-    
+# Paramètres de rendu : ils font partie de la clé de cache, toute modification invalide les QR codes existants
+QR_VERSION = 1
+QR_ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_L
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+
+QR_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+# Le QR code d'un produit ne change jamais : les clients peuvent le garder longtemps
+QR_CACHE_CONTROL = "public, max-age=86400"
+
+# QR codes déjà encodés, indexés par leur empreinte (contenu + paramètres de rendu)
+_qr_cache = TTLCache(maxsize=settings.QR_CACHE_SIZE, name="qr_codes")
+
+
+def render_qr(data: str, image_format: str) -> bytes:
+    """Encode un QR code en PNG ou en SVG (opération CPU, à exécuter hors de la boucle d'évènements)."""
     qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        version=QR_VERSION,
+        error_correction=QR_ERROR_CORRECTION,
+        box_size=QR_BOX_SIZE,
+        border=QR_BORDER,
     )
-    qr.add_data(product_url)
+    qr.add_data(data)
     qr.make(fit=True)
-    
+
+    if image_format == "svg":
+        return qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).to_string()
+
     img = qr.make_image(fill_color="black", back_color="white")
     buffer = BytesIO()
     img.save(buffer, format="PNG")
-    buffer.seek(0)
-    
-    return StreamingResponse(buffer, media_type="image/png")
+    return buffer.getvalue()
+
+
+def qr_fingerprint(data: str, image_format: str) -> str:
+    """Empreinte stable d'un QR code, utilisée comme clé de cache et comme ETag."""
+    key = f"{image_format}|{QR_VERSION}|{QR_ERROR_CORRECTION}|{QR_BOX_SIZE}|{QR_BORDER}|{data}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def qr_product_url(product_id: uuid.UUID) -> str:
+    """Adresse encodée dans le QR code d'un produit."""
+    return f"http://localhost:8000/products/{product_id}"
+
+
+def _spill_path(fingerprint: str, image_format: str) -> Optional[str]:
+    if not settings.QR_CACHE_DIR:
+        return None
+    return os.path.join(settings.QR_CACHE_DIR, f"{fingerprint}.{image_format}")
+
+
+def _read_spilled(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write_spilled(path: str, content: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def evict_qr_codes(product_id: uuid.UUID):
+    """
+    Retire les QR codes du produit (tous formats) du cache du worker et du répertoire de débordement.
+    """
+    for image_format in QR_MEDIA_TYPES:
+        fingerprint = qr_fingerprint(qr_product_url(product_id), image_format)
+        _qr_cache.pop(fingerprint)
+        spill_path = _spill_path(fingerprint, image_format)
+        if spill_path:
+            try:
+                os.remove(spill_path)
+            except FileNotFoundError:
+                pass
+
+
+@router.get("/{product_id}/generate-qr-code")
+async def generate_qr_code(
+    product_id: uuid.UUID,
+    request: Request,
+    format: Literal["png", "svg"] = "png",
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Génère un QR code pour un produit, en PNG ou en SVG.
+    Le résultat est mis en cache et servi avec un ETag fort : une requête conditionnelle
+    (`If-None-Match`) reçoit un 304 sans rendu. L'existence du produit est toujours vérifiée
+    (lecture de la clé primaire) : un produit supprimé n'a plus de QR code, quel que soit le worker.
+    """
+    if not await product_exists_async(db, product_id):
+        raise HTTPException(status_code=404, detail="Produit non trouvé.")
+
+    product_url = qr_product_url(product_id)
+    fingerprint = qr_fingerprint(product_url, format)
+    headers = {"ETag": f'"{fingerprint}"', "Cache-Control": QR_CACHE_CONTROL}
+
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    content = _qr_cache.get(fingerprint)
+    spill_path = _spill_path(fingerprint, format)
+    if content is None and spill_path:
+        content = await run_in_threadpool(_read_spilled, spill_path)
+    if content is None:
+        content = await run_in_threadpool(render_qr, product_url, format)
+        if spill_path:
+            await run_in_threadpool(_write_spilled, spill_path, content)
+    _qr_cache.set(fingerprint, content)
+
+    return Response(content, media_type=QR_MEDIA_TYPES[format], headers=headers)
@@ -1,54 +1,88 @@
-import os
+from datetime import datetime, timedelta, timezone
 
-from fastapi import UploadFile, File, APIRouter, HTTPException
-from dotenv import load_dotenv
+from fastapi import UploadFile, File, APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 from minio import Minio
+from minio.datatypes import PostPolicy
 from minio.error import S3Error
 
+from core.config import settings
+from core.metrics import LatencyRecorder
+from core.photos import public_url
+from core.storage import PHOTO_CONTENT_TYPE_PREFIX, LimitedReader, UploadTooLarge, bucket_upload_url, ensure_bucket, get_storage_client, object_name_for, presigned_object_name
+from models.models import PresignedUploadRequest, PresignedUploadResponse
+
 
-load_dotenv()
 router = APIRouter()
 
+# Durée de l'envoi vers le stockage objet (exposée par /healthcheck/metrics)
+upload_latency = LatencyRecorder("upload_img")
+
 @router.post("/upload/img")
-async def create_upload_file(file: UploadFile = File(...)):
+async def create_upload_file(file: UploadFile = File(...), client: Minio = Depends(get_storage_client)):
+    """
+    Envoie une photo vers le stockage objet.
+    Le fichier est lu par morceaux depuis le tampon de l'upload et transmis en multipart,
+    sans copie intégrale en mémoire ni fichier temporaire local.
+    """
+    if file.size is not None and file.size > settings.UPLOAD_MAX_SIZE:
+        raise HTTPException(status_code=413, detail="Fichier trop volumineux.")
 
+    destination_file = object_name_for(file.filename)
     try:
-        contents = file.file.read()
-        with open(file.filename, 'wb') as f:
-            f.write(contents)
-    except Exception:
-        raise HTTPException(status_code=500, detail='Something went wrong')
+        with upload_latency.measure():
+            await run_in_threadpool(ensure_bucket, client, settings.S3_BUCKET)
+            await run_in_threadpool(
+                client.put_object,
+                settings.S3_BUCKET,
+                destination_file,
+                LimitedReader(file.file, settings.UPLOAD_MAX_SIZE),
+                length=-1,
+                part_size=settings.UPLOAD_PART_SIZE,
+                content_type=file.content_type or "application/octet-stream",
+            )
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Fichier trop volumineux.")
+    except S3Error:
+        raise HTTPException(status_code=502, detail="Erreur du stockage objet.")
     finally:
-        file.file.close()
+        await file.close()
 
+    # Les variantes (miniature, WebP) sont générées quand la photo est rattachée à un produit
+    return {"filename": public_url(destination_file)}
 
-    # and secret key.
-    client = Minio("minio.cloud.decaweb.fr",
-        access_key=os.getenv('S3_KEYNAME'),
-        secret_key=os.getenv("S3_SECRETKEY"),
-    )
 
-    # The destination bucket and filename on the MinIO server
-    bucket_name = "pcc-staging"
-    destination_file = file.filename
+@router.post("/presign")
+async def create_presigned_upload(upload: PresignedUploadRequest, client: Minio = Depends(get_storage_client)) -> PresignedUploadResponse:
+    """
+    Délivre une politique d'envoi présignée de courte durée pour envoyer une photo directement au stockage objet :
+    le client poste `fields` puis le fichier (champ `file`, en dernier) en multipart vers `url`.
+    Le stockage refuse tout envoi qui dépasse `UPLOAD_MAX_SIZE` ou qui n'est pas une image (du type annoncé le cas échéant).
+    Une fois l'envoi terminé, la clé retournée est rattachée au produit via `POST /products/{product_id}/photos`.
+    """
+    if upload.content_type is not None and not upload.content_type.startswith(PHOTO_CONTENT_TYPE_PREFIX):
+        raise HTTPException(status_code=400, detail="Seules les images peuvent être envoyées.")
 
-    # Make the bucket if it doesn't exist.
-    found = client.bucket_exists(bucket_name)
-    if not found:
-        client.make_bucket(bucket_name)
-        print("Created bucket", bucket_name)
-    else:
-        print("Bucket", bucket_name, "already exists")
-
-    # Upload the file, renaming it in the process
-    client.fput_object(
-        bucket_name, destination_file, file.filename,
+    object_key = presigned_object_name(upload.filename)
+    policy = PostPolicy(
+        settings.S3_BUCKET,
+        datetime.now(timezone.utc) + timedelta(seconds=settings.PRESIGNED_UPLOAD_EXPIRES),
     )
+    policy.add_equals_condition("key", object_key)
+    policy.add_content_length_range_condition(1, settings.UPLOAD_MAX_SIZE)
+    if upload.content_type is not None:
+        policy.add_equals_condition("Content-Type", upload.content_type)
+    else:
+        policy.add_starts_with_condition("Content-Type", PHOTO_CONTENT_TYPE_PREFIX)
     try:
-        os.remove(file.filename)
-    except: 
-        pass
-
-    return {"filename": "minio.cloud.decaweb.fr/" + "pcc-staging/" + file.filename}
+        await run_in_threadpool(ensure_bucket, client, settings.S3_BUCKET)
+        fields = await run_in_threadpool(client.presigned_post_policy, policy)
+        url = await run_in_threadpool(bucket_upload_url, client, settings.S3_BUCKET, object_key)
+    except S3Error:
+        raise HTTPException(status_code=502, detail="Erreur du stockage objet.")
 
+    fields = {"key": object_key, **fields}
+    if upload.content_type is not None:
+        fields["Content-Type"] = upload.content_type
+    return PresignedUploadResponse(url=url, fields=fields, object_key=object_key, expires_in=settings.PRESIGNED_UPLOAD_EXPIRES)
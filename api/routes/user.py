@@ -2,42 +2,59 @@
 
 import datetime
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from db.database import get_db
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db.database import get_async_db, get_db, get_read_db
 from models.models import UserPrivate, UserCreate, UserUpdate
-from api.auth import CurrentUser
-from core.security import create_access_token, verify_password , decode_refresh_token, create_refresh_token
-from crud.crud_user import get_user_by_email, create_user, get_user_by_id
+from api.auth import CurrentUser, invalidate_user_tokens
+from core.security import create_access_token, verify_password_async, decode_refresh_token, create_refresh_token, get_password_hash_async, password_needs_rehash
+from crud.crud_user import get_user_by_email_async, get_user_credentials_async, create_user_async, get_user_by_id, get_user_updated_at, get_users_fingerprint, get_users_page, invalidate_cached_user, iter_user_batches
+from core.config import settings
+from core.conditional import collection_headers, is_not_modified, not_modified, resource_headers
+from core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from core.streaming import NDJSON_MEDIA_TYPE, ndjson_chunk
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
 from models.models import User
+from models.role import Role
 
 router = APIRouter()
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 60  # Durée d'expiration du token en minutes
 REFRESH_TOKEN_EXPIRE_DAYS = 7  # Durée d'expiration du refresh token en jours
 
+# Formats des listes d'utilisateurs : tableau JSON paginé ou flux NDJSON complet
+UserListFormat = Literal["json", "ndjson"]
+
 @router.post("/", status_code=201)
-def create_new_user(user: UserCreate, db: Session = Depends(get_db)) -> UserPrivate:
+async def create_new_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)) -> UserPrivate:
     """Crée un nouvel utilisateur et retourne un token JWT"""
-    user_exist = get_user_by_email(db, user.email)
+    user_exist = await get_user_by_email_async(db, user.email)
     if user_exist is not None:
       raise HTTPException(status_code=400, detail="L'utilisateur avec cet email existe déjà dans le système.")
-    return create_user(db, user)    
+    return await create_user_async(db, user)    
  
 
 
 @router.post("/token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """Connexion pour obtenir un token JWT en utilisant le nom d'utilisateur et le mot de passe"""
-    # Recherche l'utilisateur par email
-    user = get_user_by_email(db, form_data.username)
+    # Recherche l'utilisateur par email (hors cache, avec le hash du mot de passe)
+    user = await get_user_credentials_async(db, form_data.username)
     
     # Vérifie que l'utilisateur existe et que le mot de passe est correct
-    if not user or not verify_password(form_data.password, user.password):
+    if not user or not await verify_password_async(form_data.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Nom d'utilisateur ou mot de passe incorrect")
     
+    # Re-hache le mot de passe si le coût bcrypt configuré a changé depuis son enregistrement
+    if password_needs_rehash(user.password):
+        user.password = await get_password_hash_async(form_data.password)
+        await db.commit()
+        invalidate_cached_user(user.id)
+    
     # Crée un token d'accès avec une expiration définie
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(subject=user.id, expires_delta=access_token_expires)
@@ -84,7 +101,7 @@ def update_user(current_user: CurrentUser, user_update: UserUpdate, db: Session
     Met à jour les informations de l'utilisateur connecté.
     Les champs non fournis dans la requête ne seront pas modifiés.
     """
-    user = get_user_by_id(db, current_user.id)
+    user = db.get(User, current_user.id)
     if user is None:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé.")
     
@@ -96,6 +113,8 @@ def update_user(current_user: CurrentUser, user_update: UserUpdate, db: Session
     db.add(user)
     db.commit()
     db.refresh(user)
+    invalidate_cached_user(user.id)
+    invalidate_user_tokens(user.id)
     
     return {"message": "Utilisateur mis à jour", "user": user}
 
@@ -104,45 +123,121 @@ def delete_user(current_user: CurrentUser, db: Session = Depends(get_db)):
     """
     Supprime l'utilisateur connecté.
     """
-    user = get_user_by_id(db, current_user.id)
+    user = db.get(User, current_user.id)
     if user is None:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé.")
     
     user.deleted_at = datetime.datetime.now(datetime.timezone.utc)
+    user.updated_at = user.deleted_at
     
     db.add(user)
     db.commit()
     db.refresh(user)
+    invalidate_cached_user(user.id)
+    invalidate_user_tokens(user.id)
     
     return {"message": "Utilisateur supprimé avec succès."}
 
-@router.get("/", response_model=list[UserPrivate])
-def get_all_users(db: Session = Depends(get_db)):
-    """Retourne tous les utilisateurs."""
-    users = db.query(User).all()
+def _list_users(
+    request: Request,
+    response: Response,
+    db: Session,
+    criteria: list,
+    skip: int,
+    limit: int,
+    cursor: Optional[str],
+    format: UserListFormat,
+):
+    """
+    Liste paginée (par curseur ou skip/limit) des utilisateurs satisfaisant `criteria`,
+    ou flux NDJSON de tous ces utilisateurs (à partir du curseur s'il est fourni).
+    """
+    after = decode_cursor(cursor) if cursor is not None else None
+    headers = collection_headers(*get_users_fingerprint(db, *criteria), str(request.url.query))
+    if is_not_modified(request, headers):
+        return not_modified(headers)
+
+    if format == "ndjson":
+        return StreamingResponse(
+            _stream_users_ndjson(db.get_bind(), criteria, after),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers=headers,
+        )
+
+    response.headers.update(headers)
+    users = get_users_page(db, *criteria, skip=skip, limit=limit, after=after)
+    if users and len(users) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(users[-1].created_at, users[-1].id)
     return users
 
-@router.get("/mairies")
-def get_all_mairies(db: Session = Depends(get_db)):
-    """Retourne tous les utilisateurs identifiés comme des mairies."""
-    print("get_all_mairies")
-    mairies = db.query(User).filter(User.role == 'mairie').all()
-    if mairies is None:
-        raise HTTPException(status_code=404, detail="Aucune mairie trouvée.")
-    return mairies
+def _stream_users_ndjson(bind, criteria: list, after):
+    # Session propre au flux : celle de la dépendance est fermée avant la fin de l'envoi de la réponse
+    with Session(bind) as session:
+        for users in iter_user_batches(session, *criteria, after=after):
+            yield ndjson_chunk(users)
+
+@router.get("/", response_model=list[UserPrivate])
+def get_all_users(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=settings.PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    format: UserListFormat = "json",
+):
+    """
+    Retourne les utilisateurs triés par (created_at, id), page par page : le curseur de la page suivante
+    est renvoyé dans l'en-tête `X-Next-Cursor`. Avec `format=ndjson`, tous les utilisateurs sont streamés,
+    un objet JSON par ligne. Une requête conditionnelle sur une liste inchangée reçoit un 304.
+    """
+    return _list_users(request, response, db, [], skip, limit, cursor, format)
+
+@router.get("/mairies", response_model=list[UserPrivate])
+def get_all_mairies(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=settings.PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    format: UserListFormat = "json",
+):
+    """Retourne les utilisateurs identifiés comme des mairies (pagination et formats : voir `get_all_users`)."""
+    return _list_users(request, response, db, [User.role == Role.mairie], skip, limit, cursor, format)
 
 @router.get("/associations", response_model=list[UserPrivate])
-def get_all_associations(db: Session = Depends(get_db)):
-    """Retourne tous les utilisateurs identifiés comme des associations."""
-    associations = db.query(User).filter(User.role == 'association').all()
-    if associations is None:
-        raise HTTPException(status_code=404, detail="Aucune association trouvée.")
-    return associations
+def get_all_associations(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=settings.PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    format: UserListFormat = "json",
+):
+    """Retourne les utilisateurs identifiés comme des associations (pagination et formats : voir `get_all_users`)."""
+    return _list_users(request, response, db, [User.role == Role.association], skip, limit, cursor, format)
 
 @router.get("/{user_id}", response_model=UserPrivate)
-def get_user(user_id: uuid.UUID, db: Session = Depends(get_db)):
-    """Retourne un utilisateur par son ID."""
+def get_user(user_id: uuid.UUID, request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    Retourne un utilisateur par son ID, avec un ETag et un Last-Modified dérivés de `updated_at`.
+    Une requête conditionnelle sur un utilisateur inchangé reçoit un 304, décidé sans charger l'utilisateur.
+    """
+    updated_at = get_user_updated_at(db, user_id)
+    if updated_at is None:
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé.")
+    headers = resource_headers(updated_at)
+    if is_not_modified(request, headers):
+        return not_modified(headers)
+
     user = get_user_by_id(db, user_id)
+    if user is not None and user.updated_at != updated_at:
+        # Instantané périmé : l'utilisateur a été modifié par un autre worker
+        invalidate_cached_user(user_id)
+        user = get_user_by_id(db, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé.")
+    response.headers.update(resource_headers(user.updated_at))
     return user
@@ -0,0 +1,91 @@
+"""
+Compare le temps de rendu d'un certificat de formatage avant/après la compilation du gabarit.
+
+Usage : python -m benchmarks.bench_certificate [nombre_de_certificats]
+"""
+import sys
+import timeit
+from io import BytesIO
+from math import cos, sin, radians
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from core.certificate import STATIC_BODY_LINES, CertificateFields, render_certificate, render_certificates
+
+FIELDS = CertificateFields(
+    mairie_nom="Nanterre",
+    association_nom="Emmaüs",
+    association_prenom="Connect",
+    product_reference="PRD-20250101-abcdef12",
+    date="01-01-2025",
+)
+
+
+def render_legacy(fields: CertificateFields) -> bytes:
+    """Rendu historique de /format/generate_pdf/ : tout est redessiné, glyphe par glyphe pour le sceau."""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+
+    c.setFont("Helvetica-Bold", 18)
+    c.drawCentredString(300, 750, "Certificat de Formatage d'Ordinateur")
+    c.setFont("Helvetica", 12)
+    c.drawCentredString(300, 730, f"Délivré par la Mairie de {fields.mairie_nom}")
+
+    c.setFont("Helvetica", 11)
+    text_lines = [
+        f"Référence du produit : {fields.product_reference}",
+        f"Association bénéficiaire : {fields.association_nom} {fields.association_prenom}",
+        *STATIC_BODY_LINES,
+    ]
+    y = 670
+    for line in text_lines:
+        c.drawString(60, y, line)
+        y -= 20
+
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(100, y - 30, f"Signé par la Mairie de {fields.mairie_nom}")
+    c.setLineWidth(1)
+    c.setStrokeColor(colors.darkblue)
+    c.line(100, y - 40, 300, y - 40)
+
+    c.setFont("Helvetica", 10)
+    c.drawString(100, 50, f"Date : {fields.date}")
+    c.drawRightString(500, 50, "Page 1/1")
+
+    texte_cercle = "Liberté, égalité, fraternité,"
+    radius = 65
+    angle_step = 360 / len(texte_cercle.replace(" ", ""))
+    current_angle = 0
+    for char in texte_cercle.replace(" ", ""):
+        x = 450 + radius * cos(radians(current_angle))
+        y = 150 + radius * sin(radians(current_angle))
+        c.saveState()
+        c.translate(x, y)
+        c.rotate(current_angle + 90)
+        c.setFont("Helvetica", 8)
+        c.drawString(-3, 0, char)
+        c.restoreState()
+        current_angle += angle_step
+
+    text_maire_de_width = c.stringWidth("Maire de", "Helvetica-Bold", 10)
+    text_nom_mairie_width = c.stringWidth(fields.mairie_nom, "Helvetica-Bold", 10)
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(450 - text_maire_de_width / 2, 140, "Maire de")
+    c.drawString(450 - text_nom_mairie_width / 2, 125, fields.mairie_nom)
+
+    c.save()
+    return buffer.getvalue()
+
+
+def bench(label: str, func, number: int, certificates_per_call: int = 1):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{label:<40} {seconds / (number * certificates_per_call) * 1000:8.3f} ms/certificat")
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    bench("avant (rendu complet)", lambda: render_legacy(FIELDS), number)
+    bench("après (gabarit compilé)", lambda: render_certificate(FIELDS), number)
+    bench("après, 50 certificats par document", lambda: render_certificates([FIELDS] * 50), max(1, number // 50), 50)
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+# Caches nommés du worker, exposés par la route de métriques
+_registry: dict[str, "TTLCache"] = {}
+
+
+def cache_stats() -> dict:
+    """Retourne les compteurs (hits, misses, taille) de tous les caches nommés."""
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+class TTLCache:
+    """
+    Cache LRU en mémoire, borné en taille, dont chaque entrée expire à une échéance (timestamp epoch).
+    Les accès sont protégés par un verrou : le cache est partagé entre les threads d'un même worker.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None, name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        if name is not None:
+            _registry[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None):
+        """
+        Enregistre une valeur. Sans `expires_at`, l'entrée expire après `ttl` secondes (ou jamais).
+        """
+        if expires_at is None:
+            expires_at = time.time() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_where(self, predicate: Callable[[Any], bool]):
+        """Supprime toutes les entrées dont la valeur satisfait `predicate`."""
+        with self._lock:
+            for key in [key for key, (_, value) in self._entries.items() if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
@@ -0,0 +1,208 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from math import cos, sin, radians
+from typing import NamedTuple, Optional
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from core.config import settings
+
+# Nom du XObject contenant la partie statique du certificat
+STATIC_FORM_NAME = "certificate_static"
+
+# Corps du certificat : les deux premières lignes (référence, association) sont variables
+BODY_ORIGIN = (60, 670)
+BODY_LEADING = 20
+STATIC_BODY_LINES = [
+    "",
+    "Ce document atteste que l'ordinateur mentionné ci-dessus a été entièrement formaté. ",
+    "Toutes les données personnelles ont été supprimées conformément aux normes en vigueur, ",
+    "",
+    "Le processus de formatage inclut les étapes suivantes :",
+    "- Analyse initiale pour vérifier l'état du disque et identifier toutes les partitions existantes.",
+    "- Suppression complète des partitions et des données associées.",
+    "- Réinstallation d'un système d'exploitation propre et exempt de toute donnée résiduelle.",
+    "- Configuration minimale pour permettre un usage immédiat par les nouveaux bénéficiaires.",
+    "",
+    "L'objectif de cette opération est double :",
+    "1. Assurer la confidentialité des données de l'ancien propriétaire.",
+    "2. Préparer l'appareil pour qu'il soit pleinement opérationnel pour de nouveaux usages.",
+    "",
+    "Nous tenons à vous remercier chaleureusement pour votre générosité. Grâce à votre contribution,",
+    "vous participez activement à une démarche solidaire et responsable, en réduisant les déchets électroniques ",
+    "et en favorisant l'accès au numérique pour tous.",
+    "",
+    "Ce certificat est signé par la mairie et garantit que toutes les procédures ont été suivies.",
+]
+# Ordonnée sous la dernière ligne du corps, point de départ de la signature
+BODY_BOTTOM = BODY_ORIGIN[1] - BODY_LEADING * (len(STATIC_BODY_LINES) + 2)
+
+# Sceau circulaire : centre, rayon et texte disposé caractère par caractère
+SEAL_CENTER = (450, 150)
+SEAL_RADIUS = 65
+SEAL_TEXT = "Liberté, égalité, fraternité,"
+
+
+def _compile_seal() -> list[tuple[str, tuple[float, ...]]]:
+    """
+    Pré-calcule, pour chaque caractère du sceau, la matrice de texte (rotation + position)
+    équivalente à saveState/translate/rotate/drawString(-3, 0).
+    """
+    glyphs = SEAL_TEXT.replace(" ", "")
+    angle_step = 360 / len(glyphs)
+    compiled = []
+    for index, char in enumerate(glyphs):
+        angle = index * angle_step
+        x = SEAL_CENTER[0] + SEAL_RADIUS * cos(radians(angle))
+        y = SEAL_CENTER[1] + SEAL_RADIUS * sin(radians(angle))
+        rotation = radians(angle + 90)
+        c, s = cos(rotation), sin(rotation)
+        compiled.append((char, (c, s, -s, c, x - 3 * c, y - 3 * s)))
+    return compiled
+
+
+# Géométrie calculée une seule fois par processus
+SEAL_GLYPHS = _compile_seal()
+MAIRE_DE_WIDTH = stringWidth("Maire de", "Helvetica-Bold", 10)
+
+
+class CertificateFields(NamedTuple):
+    """Champs variables d'un certificat de formatage."""
+    mairie_nom: str
+    association_nom: str
+    association_prenom: str
+    product_reference: str
+    date: str  # jj-mm-aaaa
+
+
+def _draw_static_layer(c: canvas.Canvas):
+    """Dessine tout ce qui ne dépend pas du produit : titre, corps, filet, sceau."""
+    c.setFont("Helvetica-Bold", 18)
+    c.drawCentredString(300, 750, "Certificat de Formatage d'Ordinateur")
+
+    body = c.beginText(BODY_ORIGIN[0], BODY_ORIGIN[1] - 2 * BODY_LEADING)
+    body.setFont("Helvetica", 11, leading=BODY_LEADING)
+    body.textLines(STATIC_BODY_LINES)
+    c.drawText(body)
+
+    c.setLineWidth(1)
+    c.setStrokeColor(colors.darkblue)
+    c.line(100, BODY_BOTTOM - 40, 300, BODY_BOTTOM - 40)
+
+    c.setFont("Helvetica", 10)
+    c.drawRightString(500, 50, "Page 1/1")
+
+    seal = c.beginText()
+    seal.setFont("Helvetica", 8)
+    for char, matrix in SEAL_GLYPHS:
+        seal.setTextTransform(*matrix)
+        seal.textOut(char)
+    c.drawText(seal)
+
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(SEAL_CENTER[0] - MAIRE_DE_WIDTH / 2, 140, "Maire de")
+
+
+# Polices du gabarit, enregistrées dans cet ordre par chaque document : leurs noms internes
+# (/F1, /F2...) sont ainsi ceux référencés par le flux précompilé de la partie statique
+TEMPLATE_FONTS = ("Helvetica", "Helvetica-Bold")
+
+
+def _register_fonts(c: canvas.Canvas):
+    for font_name in TEMPLATE_FONTS:
+        c.setFont(font_name, 10)
+
+
+def _compile_static_layer() -> str:
+    """Dessine la partie statique une fois et retourne ses opérateurs PDF, à réinsérer tels quels."""
+    c = canvas.Canvas(BytesIO(), pagesize=letter)
+    _register_fonts(c)
+    _draw_static_layer(c)
+    return c.getCurrentPageContent()
+
+
+# Partie statique compilée une seule fois par processus : chaque document ne fait que l'insérer
+STATIC_LAYER_CODE = _compile_static_layer()
+
+
+def _draw_variable_layer(c: canvas.Canvas, fields: CertificateFields):
+    """Tamponne les champs propres au certificat par-dessus la partie statique."""
+    c.setFont("Helvetica", 12)
+    c.drawCentredString(300, 730, f"Délivré par la Mairie de {fields.mairie_nom}")
+
+    header = c.beginText(*BODY_ORIGIN)
+    header.setFont("Helvetica", 11, leading=BODY_LEADING)
+    header.textLine(f"Référence du produit : {fields.product_reference}")
+    header.textLine(f"Association bénéficiaire : {fields.association_nom} {fields.association_prenom}")
+    c.drawText(header)
+
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(100, BODY_BOTTOM - 30, f"Signé par la Mairie de {fields.mairie_nom}")
+
+    c.setFont("Helvetica", 10)
+    c.drawString(100, 50, f"Date : {fields.date}")
+
+    c.setFont("Helvetica-Bold", 10)
+    c.drawCentredString(SEAL_CENTER[0], 125, fields.mairie_nom)
+
+
+def render_certificates(certificates: list[CertificateFields]) -> bytes:
+    """
+    Génère un PDF contenant un certificat par page.
+    La partie statique, précompilée par processus, est insérée une fois dans un XObject
+    réutilisé sur chaque page : seuls les champs variables sont dessinés pour chaque certificat.
+    """
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    _register_fonts(c)
+
+    c.beginForm(STATIC_FORM_NAME)
+    c.addLiteral(STATIC_LAYER_CODE)
+    c.endForm()
+
+    for fields in certificates:
+        c.doForm(STATIC_FORM_NAME)
+        _draw_variable_layer(c, fields)
+        c.showPage()
+
+    c.save()
+    return buffer.getvalue()
+
+
+def render_certificate(fields: CertificateFields) -> bytes:
+    """Génère le PDF d'un seul certificat."""
+    return render_certificates([fields])
+
+
+def render_certificate_files(certificates: list[CertificateFields]) -> list[tuple[str, bytes]]:
+    """Génère un PDF par certificat et retourne les couples (référence produit, PDF)."""
+    return [(fields.product_reference, render_certificate(fields)) for fields in certificates]
+
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """
+    Retourne le pool de processus de rendu du worker, créé au premier appel.
+    ReportLab étant du Python pur, seuls des processus permettent un rendu réellement parallèle.
+    Les processus sont lancés en « spawn » : un fork du worker uvicorn hériterait de ses threads
+    (bcrypt, threadpool), de ses verrous et de ses connexions ouvertes à la base.
+    """
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=settings.CERTIFICATE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _render_pool
+
+def shutdown_render_pool():
+    """Arrête le pool de rendu s'il a été créé, en attendant la fin de ses processus."""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(cancel_futures=True)
+        _render_pool = None
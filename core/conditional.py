@@ -0,0 +1,80 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Les clients peuvent conserver la réponse mais doivent la revalider à chaque utilisation
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Compare un en-tête `If-None-Match` à un ETag (comparaison faible : le préfixe `W/` est ignoré).
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Les colonnes `updated_at` sont écrites en UTC ; les valeurs naïves sont donc interprétées comme telles
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _weak_etag(*parts) -> str:
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def resource_headers(updated_at: datetime, variant: str = "") -> dict[str, str]:
+    """
+    En-têtes de validation d'une ressource : ETag faible et Last-Modified dérivés de `updated_at`.
+    `variant` distingue les représentations d'une même ressource (paramètres de requête).
+    """
+    updated_at = _as_utc(updated_at)
+    return {
+        "ETag": _weak_etag(updated_at.isoformat(), variant),
+        "Last-Modified": format_datetime(updated_at, usegmt=True),
+        "Cache-Control": REVALIDATE_CACHE_CONTROL,
+    }
+
+
+def collection_headers(max_updated_at: Optional[datetime], count: int, variant: str = "") -> dict[str, str]:
+    """
+    En-têtes de validation d'une liste : ETag faible dérivé du dernier `updated_at` et du nombre d'éléments.
+    Pas de Last-Modified : une suppression change la liste sans avancer le dernier `updated_at`.
+    """
+    last_change = _as_utc(max_updated_at).isoformat() if max_updated_at is not None else ""
+    return {
+        "ETag": _weak_etag(last_change, count, variant),
+        "Cache-Control": REVALIDATE_CACHE_CONTROL,
+    }
+
+
+def is_not_modified(request: Request, headers: dict[str, str]) -> bool:
+    """
+    Indique si la copie du client est à jour. `If-None-Match` est prioritaire ;
+    à défaut, `If-Modified-Since` est comparé à `Last-Modified` (à la seconde près).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, headers["ETag"])
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or "Last-Modified" not in headers:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return parsedate_to_datetime(headers["Last-Modified"]) <= since
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    """Réponse 304 sans corps, portant les en-têtes de validation."""
+    return Response(status_code=304, headers=headers)
@@ -1,10 +1,95 @@
 import secrets
+from typing import Optional
 
 from pydantic_core import MultiHostUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing_extensions import Self
 
 class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
     SECRET_KEY: str = secrets.token_urlsafe(32)
 
-settings = Settings()  # type: ignore
\ No newline at end of file
+    # Pool de connexions à la base de données (appliqué aux moteurs sync et async)
+    DB_ECHO: bool = True
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800  # secondes
+
+    # DSN optionnel d'un réplica en lecture seule, utilisé par les routes de lecture.
+    # Sans valeur, les lectures passent par la base principale.
+    POSTGRES_REPLICA_URL: Optional[str] = None
+    # Nombre de lignes lues par lot sur le curseur serveur des listes streamées (NDJSON, CSV)
+    DB_STREAM_BATCH_SIZE: int = 500
+    # Taille maximale d'une page des listes paginées (paramètre `limit`)
+    PAGE_MAX_SIZE: int = 500
+
+    # Nombre maximal de produits par création groupée : l'insertion se fait en une seule requête
+    # multi-lignes, limitée par asyncpg à 32 767 paramètres (13 colonnes par produit, soit 2 520 produits au plus)
+    PRODUCT_BULK_MAX_ITEMS: int = 1000
+    # Nombre maximal de produits par changement groupé de status ou d'association
+    PRODUCT_BATCH_MAX_ITEMS: int = 1000
+
+    # Hachage bcrypt : coût, nombre de threads dédiés et taille de la file d'attente
+    # au-delà de laquelle les requêtes sont rejetées en 503.
+    BCRYPT_ROUNDS: int = 12
+    HASH_WORKERS: int = 2
+    HASH_QUEUE_SIZE: int = 16
+
+    # Nombre maximal de tokens vérifiés gardés en cache par worker
+    TOKEN_CACHE_SIZE: int = 1024
+
+    # Cache des utilisateurs (par ID et par email) : taille maximale et durée de vie en secondes
+    USER_CACHE_SIZE: int = 2048
+    USER_CACHE_TTL: int = 60
+
+    # Nombre de processus dédiés au rendu des certificats PDF en lot
+    CERTIFICATE_WORKERS: int = 2
+    # Répertoire des certificats générés (partagé entre l'API et les workers de la file de jobs)
+    CERTIFICATE_DIR: str = "./uploads/pdf"
+    # File de jobs : délai entre deux interrogations quand la file est vide, délai avant
+    # nouvelle tentative et durée au-delà de laquelle un job « running » est considéré abandonné
+    JOB_POLL_INTERVAL: float = 1.0
+    JOB_RETRY_DELAY: int = 30
+    JOB_STALE_AFTER: int = 600
+    # Traitement de la file par l'API elle-même, pour un déploiement sans `workers.certificate_worker`
+    # (service `certificate-worker` du docker-compose)
+    CERTIFICATE_JOBS_IN_API: bool = False
+
+    # Flux SSE des évènements produits : taille de la file de chaque abonné (au-delà, le flux est fermé
+    # et le client se reconnecte), intervalle des messages de maintien (et des sondes de la connexion LISTEN),
+    # délai de reconnexion du LISTEN et délai de réponse au-delà duquel la connexion est considérée perdue
+    EVENTS_QUEUE_SIZE: int = 256
+    EVENTS_HEARTBEAT: float = 15.0
+    EVENTS_RECONNECT_DELAY: float = 5.0
+    EVENTS_LIVENESS_TIMEOUT: float = 5.0
+
+    # Cache des QR codes encodés : nombre d'entrées en mémoire et répertoire optionnel de débordement sur disque
+    QR_CACHE_SIZE: int = 512
+    QR_CACHE_DIR: Optional[str] = None
+
+    # Stockage objet (S3 / MinIO) des photos produits
+    S3_ENDPOINT: str = "minio.cloud.decaweb.fr"
+    S3_BUCKET: str = "pcc-staging"
+    S3_SECURE: bool = True
+    S3_REGION: Optional[str] = None
+    S3_KEYNAME: Optional[str] = None
+    S3_SECRETKEY: Optional[str] = None
+    # Connexions HTTP gardées ouvertes vers le stockage, et délai maximal (secondes) par opération
+    S3_POOL_SIZE: int = 20
+    S3_TIMEOUT: float = 300
+
+    # Envoi des photos : taille maximale acceptée et taille des parties multipart (minimum 5 Mio)
+    UPLOAD_MAX_SIZE: int = 20 * 1024 * 1024
+    UPLOAD_PART_SIZE: int = 5 * 1024 * 1024
+    # Durée de validité (secondes) des URLs présignées d'envoi direct vers le stockage
+    PRESIGNED_UPLOAD_EXPIRES: int = 900
+
+    # Variantes des photos (miniature et WebP) générées en arrière-plan après chaque envoi
+    IMAGE_WORKERS: int = 2
+    IMAGE_THUMBNAIL_SIZE: int = 320
+    IMAGE_WEBP_MAX_SIZE: int = 1600
+    IMAGE_WEBP_QUALITY: int = 80
+
+settings = Settings()  # type: ignore
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import asyncpg
+from sqlalchemy import text
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from core.config import settings
+from models.models import Product
+from models.status import Status
+
+logger = logging.getLogger(__name__)
+
+# Canal Postgres des évènements produits (création, status, association, suppression)
+PRODUCT_EVENTS_CHANNEL = "product_events"
+
+# Un seul aller-retour quel que soit le nombre d'évènements ; les notifications ne sont
+# délivrées qu'au commit de la transaction, et jamais si elle est annulée
+NOTIFY_PRODUCT_EVENTS = text(
+    "SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"
+)
+
+
+def product_event(kind: str, product: Product, previous_association_user_id: Optional[uuid.UUID] = None) -> dict:
+    """
+    Évènement `kind` (created, status, association, deleted) décrivant l'état du produit après la modification.
+    """
+    return {
+        "type": kind,
+        "product_id": str(product.id),
+        "reference": product.reference,
+        "status": Status(product.status).value,
+        "mairie_user_id": str(product.mairie_user_id),
+        "association_user_id": str(product.association_user_id) if product.association_user_id else None,
+        "previous_association_user_id": str(previous_association_user_id) if previous_association_user_id else None,
+    }
+
+
+def _notify_params(events: list[dict]) -> dict:
+    return {"channel": PRODUCT_EVENTS_CHANNEL, "payloads": [json.dumps(event) for event in events]}
+
+
+def notify_product_events(db: Session, events: list[dict]):
+    """Publie les évènements sur le canal des produits, dans la transaction en cours."""
+    if events:
+        db.execute(NOTIFY_PRODUCT_EVENTS, _notify_params(events))
+
+
+async def notify_product_events_async(db: AsyncSession, events: list[dict]):
+    """Publie les évènements sur le canal des produits, dans la transaction en cours (session asynchrone)."""
+    if events:
+        await db.execute(NOTIFY_PRODUCT_EVENTS, _notify_params(events))
+
+
+def format_sse(event: dict) -> str:
+    """Met en forme un évènement pour un flux `text/event-stream`."""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+class Subscription:
+    """File des évènements d'un abonné, filtrés par mairie et/ou par association."""
+
+    def __init__(self, mairie_user_id: Optional[uuid.UUID], association_user_id: Optional[uuid.UUID]):
+        self.mairie_user_id = str(mairie_user_id) if mairie_user_id else None
+        self.association_user_id = str(association_user_id) if association_user_id else None
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        # Passe à True si l'abonné ne consomme pas assez vite : il ne reçoit plus d'évènements
+        self.overflowed = False
+
+    def matches(self, event: dict) -> bool:
+        if self.mairie_user_id and event["mairie_user_id"] == self.mairie_user_id:
+            return True
+        # L'association qui perd un produit est aussi prévenue
+        return bool(self.association_user_id) and self.association_user_id in (
+            event["association_user_id"],
+            event["previous_association_user_id"],
+        )
+
+
+class ProductEventBroker:
+    """
+    Écoute le canal des évènements produits sur une unique connexion Postgres par worker
+    et redistribue chaque notification aux abonnés concernés.
+    La connexion est rétablie automatiquement si elle est perdue.
+    """
+
+    def __init__(self, channel: str = PRODUCT_EVENTS_CHANNEL):
+        self.channel = channel
+        self.connected = asyncio.Event()
+        self._subscriptions: set[Subscription] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, dsn: str):
+        """Lance l'écoute en tâche de fond ; le démarrage du worker n'attend pas la connexion."""
+        if self._task is None:
+            self.connected = asyncio.Event()
+            self._task = asyncio.create_task(self._listen(dsn))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self, dsn: str):
+        while True:
+            try:
+                await self._listen_once(dsn)
+                logger.warning("Connexion LISTEN perdue, reconnexion dans %ss", settings.EVENTS_RECONNECT_DELAY)
+            except (OSError, TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.warning("Écoute LISTEN interrompue (%s), reconnexion dans %ss", e, settings.EVENTS_RECONNECT_DELAY)
+            except Exception:
+                # Aucune erreur ne doit arrêter la tâche : le worker cesserait de diffuser sans le signaler
+                logger.exception("Erreur inattendue de l'écoute LISTEN, reconnexion dans %ss", settings.EVENTS_RECONNECT_DELAY)
+            await asyncio.sleep(settings.EVENTS_RECONNECT_DELAY)
+
+    async def _listen_once(self, dsn: str):
+        """
+        Écoute le canal sur une nouvelle connexion jusqu'à sa perte. Toutes les `EVENTS_HEARTBEAT` secondes,
+        la connexion est sondée : une connexion à moitié ouverte (bascule, expiration NAT) ne se ferme jamais
+        d'elle-même, et les abonnés ne recevraient plus rien sans que le flux ne soit coupé.
+        """
+        connection = await asyncpg.connect(dsn)
+        lost = asyncio.Event()
+        try:
+            connection.add_termination_listener(lambda _: lost.set())
+            await connection.add_listener(self.channel, self._dispatch)
+            self.connected.set()
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), timeout=settings.EVENTS_HEARTBEAT)
+                except TimeoutError:
+                    await asyncio.wait_for(connection.execute("SELECT 1"), timeout=settings.EVENTS_LIVENESS_TIMEOUT)
+        finally:
+            self.connected.clear()
+            if not connection.is_closed():
+                # Fermeture bornée : sur une connexion morte, asyncpg finit par la couper sans attendre le serveur
+                await connection.close(timeout=settings.EVENTS_LIVENESS_TIMEOUT)
+
+    def _dispatch(self, connection, pid: int, channel: str, payload: str):
+        event = json.loads(payload)
+        for subscription in list(self._subscriptions):
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+                self._subscriptions.discard(subscription)
+
+    @contextmanager
+    def subscribe(
+        self,
+        mairie_user_id: Optional[uuid.UUID] = None,
+        association_user_id: Optional[uuid.UUID] = None,
+    ) -> Iterator[Subscription]:
+        """Abonne l'appelant aux évènements de la mairie et/ou de l'association, le temps du bloc."""
+        subscription = Subscription(mairie_user_id, association_user_id)
+        self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscriptions.discard(subscription)
+
+
+# Diffuseur partagé par toutes les requêtes du worker, démarré par le cycle de vie de l'application
+product_events = ProductEventBroker()
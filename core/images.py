@@ -0,0 +1,83 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, Optional
+
+from minio import Minio
+from PIL import Image, ImageOps
+
+from core.config import settings
+from core.photos import DERIVATIVE_SUFFIXES
+
+logger = logging.getLogger(__name__)
+
+# Pool dédié : Pillow relâche le GIL pendant le décodage, le redimensionnement et l'encodage
+_image_executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="images")
+
+
+def _encode_webp(image: Image.Image, max_size: Optional[int]) -> bytes:
+    if max_size is not None:
+        image = image.copy()
+        image.thumbnail((max_size, max_size))
+    buffer = BytesIO()
+    image.save(buffer, format="WEBP", quality=settings.IMAGE_WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def generate_derivatives(client: Minio, bucket_name: str, object_name: str):
+    """
+    Télécharge une photo et enregistre sa miniature et sa version WebP à côté de l'original.
+    """
+    response = client.get_object(bucket_name, object_name)
+    try:
+        original = response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+    with Image.open(BytesIO(original)) as image:
+        # Décodage JPEG directement à une résolution réduite quand c'est possible
+        image.draft("RGB", (settings.IMAGE_WEBP_MAX_SIZE, settings.IMAGE_WEBP_MAX_SIZE))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        variants = {
+            "webp": _encode_webp(image, settings.IMAGE_WEBP_MAX_SIZE),
+            "thumbnail": _encode_webp(image, settings.IMAGE_THUMBNAIL_SIZE),
+        }
+
+    for kind, content in variants.items():
+        client.put_object(
+            bucket_name,
+            object_name + DERIVATIVE_SUFFIXES[kind],
+            BytesIO(content),
+            length=len(content),
+            content_type="image/webp",
+        )
+
+
+def _log_failure(future: Future):
+    if future.exception() is not None:
+        logger.error("Échec de la génération des variantes d'image", exc_info=future.exception())
+
+
+def _generate_then(client: Minio, bucket_name: str, object_name: str, on_generated: Optional[Callable[[], None]]):
+    generate_derivatives(client, bucket_name, object_name)
+    if on_generated is not None:
+        on_generated()
+
+
+def schedule_derivatives(
+    client: Minio,
+    bucket_name: str,
+    object_name: str,
+    on_generated: Optional[Callable[[], None]] = None,
+) -> Future:
+    """
+    Planifie la génération des variantes d'une photo en arrière-plan.
+    `on_generated` est appelé (dans le même thread) une fois les variantes enregistrées, jamais en cas d'échec.
+    """
+    future = _image_executor.submit(_generate_then, client, bucket_name, object_name, on_generated)
+    future.add_done_callback(_log_failure)
+    return future
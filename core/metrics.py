@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Mesures de latence nommées du worker, exposées par la route de métriques
+_registry: dict[str, "LatencyRecorder"] = {}
+
+
+def latency_stats() -> dict:
+    """Retourne le résumé (nombre, moyenne, p50, p95, max) de toutes les mesures de latence."""
+    return {name: recorder.stats() for name, recorder in _registry.items()}
+
+
+class LatencyRecorder:
+    """
+    Enregistre la durée d'une opération et conserve les `window` dernières mesures pour les percentiles.
+    """
+
+    def __init__(self, name: str, window: int = 1024):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def record(self, seconds: float, error: bool = False):
+        with self._lock:
+            self.count += 1
+            self.errors += int(error)
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self._recent.append(seconds)
+
+    @contextmanager
+    def measure(self):
+        """Mesure la durée du bloc ; une exception est comptée comme erreur puis propagée."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(time.perf_counter() - start, error=True)
+            raise
+        self.record(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            count, errors, total, maximum = self.count, self.errors, self.total, self.max
+
+        def percentile(p: float) -> float:
+            return recent[min(len(recent) - 1, int(p * len(recent)))] * 1000 if recent else 0.0
+
+        return {
+            "count": count,
+            "errors": errors,
+            "avg_ms": total / count * 1000 if count else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": maximum * 1000,
+        }
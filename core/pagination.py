@@ -0,0 +1,32 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+
+from fastapi import HTTPException, status
+
+# En-tête portant le curseur de la page suivante (exposé au front via CORS)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, item_id: uuid.UUID) -> str:
+    """
+    Encode la position (created_at, id) du dernier élément d'une page en un curseur opaque.
+    """
+    raw = json.dumps([created_at.isoformat(), str(item_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """
+    Décode un curseur produit par `encode_cursor`.
+    Si le curseur est illisible, une exception HTTP 400 est levée.
+    """
+    try:
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), uuid.UUID(item_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Curseur de pagination invalide",
+        )
@@ -0,0 +1,34 @@
+from typing import Optional
+
+from core.config import settings
+
+# URLs des photos et de leurs variantes. Module sans dépendance lourde : il est importé par les modèles.
+
+# Variantes générées pour chaque photo, stockées à côté de l'original : <objet><suffixe>
+DERIVATIVE_SUFFIXES = {
+    "thumbnail": ".thumb.webp",
+    "webp": ".webp",
+}
+
+
+def public_url(object_name: str) -> str:
+    """URL (sans schéma) d'un objet du bucket, telle que stockée dans `Product.photos`."""
+    return f"{settings.S3_ENDPOINT}/{settings.S3_BUCKET}/{object_name}"
+
+
+def object_name_from_url(photo_url: str) -> Optional[str]:
+    """Nom de l'objet d'une photo de notre bucket, ou None pour une photo hébergée ailleurs."""
+    prefix = public_url("")
+    if not photo_url.startswith(prefix) or photo_url == prefix:
+        return None
+    return photo_url[len(prefix):]
+
+
+def derivative_url(photo_url: str, kind: str) -> str:
+    """
+    URL de la variante `kind` d'une photo. Les photos hors de notre bucket n'ont pas de variante :
+    l'URL d'origine est alors retournée.
+    """
+    if object_name_from_url(photo_url) is None:
+        return photo_url
+    return photo_url + DERIVATIVE_SUFFIXES[kind]
@@ -1,5 +1,8 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, Callable
 from fastapi import HTTPException, status
 
 import jwt
@@ -93,6 +96,46 @@ def verify_password(plain_password: str, hashed_password: bytes) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password)
 
 def get_password_hash(password: str) -> str:
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed_password.decode('utf-8')
\ No newline at end of file
+    return hashed_password.decode('utf-8')
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """
+    Indique si un hash bcrypt ($2b$<coût>$...) a été calculé avec un coût différent de celui configuré.
+    """
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+# Pool de threads dédié à bcrypt : le calcul ne bloque ni la boucle d'évènements ni le
+# threadpool des routes synchrones. Le sémaphore borne le travail en cours + en attente.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = threading.BoundedSemaphore(settings.HASH_WORKERS + settings.HASH_QUEUE_SIZE)
+
+async def _run_hashing(func: Callable, *args) -> Any:
+    """
+    Exécute une opération bcrypt sur le pool dédié.
+    Si le pool et sa file d'attente sont pleins, une exception HTTP 503 est levée immédiatement.
+    """
+    if not _hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Service d'authentification surchargé, veuillez réessayer",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        future = _hash_executor.submit(func, *args)
+    except BaseException:
+        _hash_slots.release()
+        raise
+    future.add_done_callback(lambda _: _hash_slots.release())
+    return await asyncio.wrap_future(future)
+
+async def verify_password_async(plain_password: str, hashed_password: bytes) -> bool:
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_hashing(get_password_hash, password)
\ No newline at end of file
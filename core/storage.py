@@ -0,0 +1,115 @@
+import os
+import threading
+import uuid
+from typing import BinaryIO, Optional
+from urllib.parse import unquote, urlsplit, urlunsplit
+
+import certifi
+import urllib3
+from minio import Minio
+
+from core.config import settings
+
+
+class UploadTooLarge(Exception):
+    """Levée quand un envoi dépasse `UPLOAD_MAX_SIZE`."""
+
+
+class LimitedReader:
+    """
+    Enveloppe un flux binaire et lève `UploadTooLarge` dès que plus de `max_size` octets ont été lus,
+    sans jamais charger le fichier entier en mémoire.
+    """
+
+    def __init__(self, stream: BinaryIO, max_size: int):
+        self._stream = stream
+        self._remaining = max_size
+
+    def read(self, size: int = -1) -> bytes:
+        # Lit un octet de plus que la limite restante pour détecter un dépassement
+        if size is None or size < 0 or size > self._remaining + 1:
+            size = self._remaining + 1
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise UploadTooLarge()
+        return data
+
+
+def object_name_for(filename: str) -> str:
+    """Nom de l'objet dans le bucket : nom de fichier du client, sans aucun chemin."""
+    return os.path.basename(filename.replace("\\", "/")) or "upload"
+
+
+# Préfixe des objets envoyés directement par les clients via une URL présignée
+PRESIGNED_PREFIX = "products/"
+
+
+# Seules les photos peuvent être envoyées directement au stockage
+PHOTO_CONTENT_TYPE_PREFIX = "image/"
+
+
+def presigned_object_name(filename: str) -> str:
+    """Nom unique d'un objet destiné à un envoi présigné."""
+    return f"{PRESIGNED_PREFIX}{uuid.uuid4().hex}-{object_name_for(filename)}"
+
+
+def bucket_upload_url(client: Minio, bucket_name: str, object_name: str) -> str:
+    """
+    URL à laquelle envoyer le formulaire POST d'une politique présignée : celle du bucket,
+    dans le style d'adressage du client (chemin ou hôte virtuel). Déduite d'une URL présignée, calculée localement.
+    """
+    url = urlsplit(client.presigned_get_object(bucket_name, object_name))
+    path = unquote(url.path).removesuffix(f"/{object_name}")
+    return urlunsplit((url.scheme, url.netloc, path, "", ""))
+
+
+# Client partagé par toutes les requêtes du worker (pool de connexions HTTP commun)
+_storage_client: Optional[Minio] = None
+# Buckets dont l'existence a déjà été vérifiée (ou qui ont été créés) par ce worker
+_checked_buckets: set[str] = set()
+_bucket_lock = threading.Lock()
+
+
+def init_storage() -> Minio:
+    """
+    Crée le client du stockage objet et son pool de connexions. Appelé au démarrage de l'application.
+    """
+    global _storage_client
+    http_client = urllib3.PoolManager(
+        maxsize=settings.S3_POOL_SIZE,
+        timeout=urllib3.Timeout(connect=settings.S3_TIMEOUT, read=settings.S3_TIMEOUT),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+    )
+    _storage_client = Minio(
+        settings.S3_ENDPOINT,
+        access_key=settings.S3_KEYNAME,
+        secret_key=settings.S3_SECRETKEY,
+        secure=settings.S3_SECURE,
+        region=settings.S3_REGION,
+        http_client=http_client,
+    )
+    return _storage_client
+
+
+def get_storage_client() -> Minio:
+    """Client partagé du stockage objet configuré dans `Settings`."""
+    if _storage_client is None:
+        return init_storage()
+    return _storage_client
+
+
+def ensure_bucket(client: Minio, bucket_name: str):
+    """
+    Crée le bucket s'il n'existe pas. La vérification n'est faite qu'une fois par worker.
+    """
+    if bucket_name in _checked_buckets:
+        return
+    with _bucket_lock:
+        if bucket_name in _checked_buckets:
+            return
+        if not client.bucket_exists(bucket_name):
+            client.make_bucket(bucket_name)
+        _checked_buckets.add(bucket_name)
@@ -0,0 +1,63 @@
+import csv
+import json
+import uuid
+from datetime import datetime
+from enum import Enum
+from io import StringIO
+from typing import Any, Iterable, Mapping
+
+from sqlmodel import SQLModel
+
+# Une ligne JSON par élément : le client peut traiter la liste au fil de l'eau
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+
+
+def ndjson_chunk(items: Iterable[SQLModel]) -> str:
+    """Sérialise un lot d'éléments en NDJSON (un objet JSON par ligne)."""
+    return "".join(item.model_dump_json() + "\n" for item in items)
+
+
+def _plain_value(value: Any) -> Any:
+    """Convertit les valeurs lues en base (UUID, dates, énumérations) en types JSON."""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def ndjson_rows_chunk(rows: Iterable[Mapping[str, Any]]) -> str:
+    """Sérialise un lot de lignes de résultat (colonne -> valeur) en NDJSON."""
+    return "".join(
+        json.dumps({key: _plain_value(value) for key, value in row.items()}, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def _csv_cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return json.dumps(value, ensure_ascii=False)
+    return _plain_value(value)
+
+
+def csv_chunk(rows: Iterable[Mapping[str, Any]], columns: list[str]) -> str:
+    """
+    Sérialise un lot de lignes de résultat en CSV, dans l'ordre de `columns`.
+    Les listes (photos) sont écrites en JSON dans leur cellule ; les valeurs nulles en cellule vide.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_csv_cell(row[column]) for column in columns])
+    return buffer.getvalue()
+
+
+def csv_header(columns: list[str]) -> str:
+    buffer = StringIO()
+    csv.writer(buffer).writerow(columns)
+    return buffer.getvalue()
@@ -0,0 +1,113 @@
+import uuid
+from typing import Optional
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from core.config import settings
+from models.models import CertificateJob
+
+
+def create_certificate_job(db: Session, mairie_user_id: uuid.UUID, association_user_id: uuid.UUID, product_reference: str) -> CertificateJob:
+    """
+    Ajoute un job de génération de certificat à la file d'attente.
+    """
+    job = CertificateJob(
+        mairie_user_id=mairie_user_id,
+        association_user_id=association_user_id,
+        product_reference=product_reference,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_job_by_id(db: Session, job_id: uuid.UUID) -> CertificateJob:
+    """
+    Recherche un job par son ID.
+    """
+    return db.get(CertificateJob, job_id)
+
+
+# Réserve le plus ancien job exécutable. SKIP LOCKED permet à plusieurs workers d'interroger
+# la file en parallèle sans se bloquer ni réserver deux fois le même job. Les jobs « running »
+# dont le worker ne donne plus signe de vie sont repris tant qu'il leur reste des tentatives.
+CLAIM_NEXT_JOB = text("""
+    UPDATE certificatejob
+    SET status = 'running', attempts = attempts + 1, progress = 10,
+        started_at = now(), updated_at = now(), error = NULL
+    WHERE id = (
+        SELECT id FROM certificatejob
+        WHERE (status = 'pending' AND run_after <= now())
+           OR (status = 'running' AND attempts < max_attempts
+               AND updated_at < now() - make_interval(secs => :stale_after))
+        ORDER BY run_after
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING id
+""")
+
+# Jobs abandonnés par leur worker lors de la dernière tentative : ils ne seront plus repris
+FAIL_STALE_JOBS = text("""
+    UPDATE certificatejob
+    SET status = 'failed', finished_at = now(), updated_at = now(),
+        error = 'Worker interrompu pendant la dernière tentative.'
+    WHERE status = 'running' AND attempts >= max_attempts
+      AND updated_at < now() - make_interval(secs => :stale_after)
+""")
+
+
+def claim_next_job(db: Session) -> Optional[CertificateJob]:
+    """
+    Réserve le prochain job en attente pour ce worker, ou retourne None si la file est vide.
+    """
+    db.execute(FAIL_STALE_JOBS, {"stale_after": settings.JOB_STALE_AFTER})
+    job_id = db.execute(CLAIM_NEXT_JOB, {"stale_after": settings.JOB_STALE_AFTER}).scalar()
+    db.commit()
+    if job_id is None:
+        return None
+    return db.get(CertificateJob, job_id)
+
+
+def update_job_progress(db: Session, job: CertificateJob, progress: int):
+    job.progress = progress
+    db.execute(
+        text("UPDATE certificatejob SET progress = :progress, updated_at = now() WHERE id = :id"),
+        {"progress": progress, "id": job.id},
+    )
+    db.commit()
+
+
+def complete_job(db: Session, job: CertificateJob, file_path: str):
+    db.execute(
+        text("""
+            UPDATE certificatejob
+            SET status = 'done', progress = 100, file_path = :file_path, finished_at = now(), updated_at = now()
+            WHERE id = :id
+        """),
+        {"file_path": file_path, "id": job.id},
+    )
+    db.commit()
+
+
+def fail_job(db: Session, job: CertificateJob, error: str):
+    """
+    Enregistre l'échec d'un job : il est reprogrammé tant qu'il reste des tentatives, sinon marqué « failed ».
+    """
+    # Lu avant le rollback, qui expire l'instance : la relire ferait une requête, vouée à l'échec si la base est en cause
+    job_id = job.id
+    db.rollback()
+    db.execute(
+        text("""
+            UPDATE certificatejob
+            SET status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END::jobstatus,
+                run_after = now() + make_interval(secs => :retry_delay),
+                finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE now() END,
+                error = :error, progress = 0, updated_at = now()
+            WHERE id = :id
+        """),
+        {"retry_delay": settings.JOB_RETRY_DELAY, "error": error[:1000], "id": job_id},
+    )
+    db.commit()
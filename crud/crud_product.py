@@ -1,11 +1,369 @@
 import uuid
+from datetime import datetime, timezone
+from typing import Collection, Iterator, Optional
+from sqlalchemy import Select, any_, bindparam, cast, func, literal_column, or_, select, union, update, Uuid
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, insert
+from sqlalchemy.orm import aliased, noload, selectinload
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from models.models import Product
+from core.config import settings
+from core.events import notify_product_events_async, product_event
+from models.models import AssociationStatusStats, MairieStatusStats, Product, ProductStatusCount, User
+from models.status import Status
 
+# Configuration de recherche plein texte, identique à celle de la colonne générée `search_vector`
+SEARCH_CONFIG = literal_column("'french'::regconfig")
+# Colonne générée par la migration 3, non mappée sur le modèle
+SEARCH_VECTOR = literal_column("product.search_vector")
 
-def get_product_by_id(db: Session, product_id: uuid.UUID) -> Product:
+
+def product_load_options(expand: Collection[str]) -> list:
+    """
+    Options de chargement des utilisateurs liés à un produit : les relations demandées dans `expand`
+    sont chargées en une requête `IN` par relation pour toute la page, les autres ne sont jamais chargées.
+    """
+    relationships = {
+        "user": Product.user,
+        "mairie_user": Product.mairie_user,
+        "association_user": Product.association_user,
+    }
+    return [
+        selectinload(relationship) if name in expand else noload(relationship)
+        for name, relationship in relationships.items()
+    ]
+
+
+def new_product_reference() -> str:
+    """Génère une référence produit `PRD-<aaaammjj>-<8 caractères hexadécimaux>`."""
+    return f"PRD-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8]}"
+
+
+def get_product_by_id(
+    db: Session,
+    product_id: uuid.UUID,
+    for_update: bool = False,
+    expand: Optional[Collection[str]] = None,
+) -> Product:
     """
     Recherche un produit par son ID.
+    Avec `for_update`, la ligne reste verrouillée jusqu'à la fin de la transaction ;
+    avec `expand`, seuls les utilisateurs liés demandés sont chargés (voir `product_load_options`).
+    """
+    options = product_load_options(expand) if expand is not None else []
+    return db.get(Product, product_id, with_for_update=for_update, options=options)
+
+
+async def get_product_by_id_async(db: AsyncSession, product_id: uuid.UUID, for_update: bool = False) -> Product:
+    """
+    Recherche un produit par son ID (session asynchrone).
+    Avec `for_update`, la ligne reste verrouillée jusqu'à la fin de la transaction.
+    """
+    return await db.get(Product, product_id, with_for_update=for_update)
+
+
+async def product_exists_async(db: AsyncSession, product_id: uuid.UUID) -> bool:
+    """
+    Indique si le produit existe, sans le charger (session asynchrone).
+    """
+    return await db.scalar(select(Product.id).where(Product.id == product_id)) is not None
+
+
+def get_product_updated_at(db: Session, product_id: uuid.UUID) -> Optional[datetime]:
+    """
+    Retourne la date de dernière modification d'un produit (None s'il n'existe pas), sans charger le produit.
+    """
+    return db.execute(select(Product.updated_at).where(Product.id == product_id)).scalar()
+
+
+def get_products_fingerprint(db: Session, *criteria) -> tuple[Optional[datetime], int]:
+    """
+    Retourne la dernière modification et le nombre des produits satisfaisant `criteria`.
+    Sans critère, le nombre est lu dans les compteurs par status plutôt que par un parcours de la table.
+    """
+    if criteria:
+        return tuple(db.execute(
+            select(func.max(Product.updated_at), func.count()).select_from(Product).where(*criteria)
+        ).one())
+    return tuple(db.execute(select(
+        select(func.max(Product.updated_at)).scalar_subquery(),
+        select(func.coalesce(func.sum(ProductStatusCount.count), 0)).scalar_subquery(),
+    )).one())
+
+
+# Clé étrangère de chaque relation utilisateur pouvant être intégrée via `expand`
+EXPAND_FOREIGN_KEYS = {
+    "user": "user_id",
+    "mairie_user": "mairie_user_id",
+    "association_user": "association_user_id",
+}
+
+
+def get_expanded_users_updated_at(db: Session, products: Select, expand: Collection[str]) -> Optional[datetime]:
+    """
+    Retourne la dernière modification des utilisateurs intégrés (selon `expand`) aux produits sélectionnés
+    par `products` (requête sur `Product`, éventuellement paginée). Seuls ces utilisateurs sont lus, par clé primaire.
+    """
+    selected = products.subquery()
+    user_ids = union(*[select(selected.c[EXPAND_FOREIGN_KEYS[relation]]) for relation in expand])
+    return db.execute(select(func.max(User.updated_at)).where(User.id.in_(user_ids))).scalar()
+
+
+def search_products(db: Session, q: str, skip: int = 0, limit: int = 10, expand: Collection[str] = ()) -> list[Product]:
+    """
+    Recherche des produits par mots-clés (titre, marque, description, panne) et, de façon approchée,
+    par marque ou référence. Les résultats sont triés par pertinence décroissante.
+    """
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    similarity = func.greatest(func.similarity(Product.marque, q), func.similarity(Product.reference, q))
+    rank = func.ts_rank(SEARCH_VECTOR, tsquery) + similarity
+
+    return (
+        db.query(Product)
+        .options(*product_load_options(expand))
+        .filter(or_(
+            SEARCH_VECTOR.op("@@")(tsquery),
+            Product.marque.op("%")(q),
+            Product.reference.op("%")(q),
+        ))
+        .order_by(rank.desc(), Product.created_at, Product.id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+
+# Clé d'un compteur de produits : (mairie, association, status)
+StatusCountKey = tuple[uuid.UUID, Optional[uuid.UUID], Status]
+
+
+def _status_counts_upsert(deltas: dict[StatusCountKey, int]):
+    # Une seule ligne par clé : ON CONFLICT ne peut pas mettre à jour deux fois la même ligne
+    statement = insert(ProductStatusCount).values([
+        {
+            "id": uuid.uuid4(),
+            "mairie_user_id": mairie_user_id,
+            "association_user_id": association_user_id,
+            "status": status,
+            "count": delta,
+        }
+        for (mairie_user_id, association_user_id, status), delta in deltas.items()
+    ])
+    return statement.on_conflict_do_update(
+        constraint="uq_productstatuscount_mairie_association_status",
+        set_={"count": ProductStatusCount.count + statement.excluded.count},
+    )
+
+
+def adjust_status_count(db: Session, mairie_user_id: uuid.UUID, association_user_id: Optional[uuid.UUID], status: Status, delta: int):
+    """
+    Ajoute `delta` au compteur (mairie, association, status), dans la transaction en cours.
+    """
+    db.execute(_status_counts_upsert({(mairie_user_id, association_user_id, status): delta}))
+
+
+async def adjust_status_count_async(db: AsyncSession, mairie_user_id: uuid.UUID, association_user_id: Optional[uuid.UUID], status: Status, delta: int):
     """
-    return db.get(Product, product_id)
+    Ajoute `delta` au compteur (mairie, association, status), dans la transaction en cours (session asynchrone).
+    """
+    await adjust_status_counts_async(db, {(mairie_user_id, association_user_id, status): delta})
+
+
+async def adjust_status_counts_async(db: AsyncSession, deltas: dict[StatusCountKey, int]):
+    """
+    Applique plusieurs variations de compteurs en une seule requête, dans la transaction en cours (session asynchrone).
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if deltas:
+        await db.execute(_status_counts_upsert(deltas))
+
+
+def get_mairie_status_stats(db: Session, mairie_user_id: uuid.UUID) -> MairieStatusStats:
+    """
+    Retourne le nombre de produits de la mairie par status, au total et par association,
+    à partir des compteurs : le coût ne dépend pas du nombre de produits.
+    """
+    rows = db.execute(
+        select(ProductStatusCount.association_user_id, ProductStatusCount.status, ProductStatusCount.count)
+        .where(ProductStatusCount.mairie_user_id == mairie_user_id, ProductStatusCount.count > 0)
+    ).all()
+
+    by_status = dict.fromkeys(Status, 0)
+    associations: dict[Optional[uuid.UUID], dict[Status, int]] = {}
+    for association_user_id, status, count in rows:
+        by_status[status] += count
+        associations.setdefault(association_user_id, dict.fromkeys(Status, 0))[status] += count
+
+    return MairieStatusStats(
+        mairie_user_id=mairie_user_id,
+        total=sum(by_status.values()),
+        by_status=by_status,
+        associations=[
+            AssociationStatusStats(association_user_id=association_user_id, total=sum(counts.values()), by_status=counts)
+            for association_user_id, counts in associations.items()
+        ],
+    )
+
+
+# Colonnes ajoutées à l'export quand les noms de l'association et du donateur sont demandés
+EXPORT_NAME_COLUMNS = ["association_nom", "association_prenom", "user_nom", "user_prenom"]
+
+
+# Colonnes internes, absentes de l'export
+EXPORT_EXCLUDED_COLUMNS = {"photo_derivatives"}
+
+
+def _export_columns() -> list:
+    return [column for column in Product.__table__.columns if column.name not in EXPORT_EXCLUDED_COLUMNS]
+
+
+def product_export_columns(with_names: bool) -> list[str]:
+    """Noms des colonnes de l'export des produits d'une mairie, dans l'ordre."""
+    columns = [column.name for column in _export_columns()]
+    return columns + EXPORT_NAME_COLUMNS if with_names else columns
+
+
+def iter_mairie_product_batches(
+    db: Session,
+    mairie_user_id: uuid.UUID,
+    with_names: bool = False,
+    batch_size: int = settings.DB_STREAM_BATCH_SIZE,
+) -> Iterator[list[dict]]:
+    """
+    Parcourt tous les produits d'une mairie, triés par (created_at, id), par lots de `batch_size` lignes
+    (colonne -> valeur) lus sur un curseur côté serveur : la mémoire utilisée ne dépend pas du nombre de produits.
+    """
+    columns = _export_columns()
+    query = select(*columns)
+    if with_names:
+        association = aliased(User)
+        donor = aliased(User)
+        query = (
+            select(
+                *columns,
+                association.nom.label("association_nom"),
+                association.prenom.label("association_prenom"),
+                donor.nom.label("user_nom"),
+                donor.prenom.label("user_prenom"),
+            )
+            .outerjoin(association, Product.association_user_id == association.id)
+            .outerjoin(donor, Product.user_id == donor.id)
+        )
+    query = query.where(Product.mairie_user_id == mairie_user_id).order_by(Product.created_at, Product.id)
+
+    result = db.execute(query.execution_options(yield_per=batch_size))
+    for rows in result.mappings().partitions():
+        yield [dict(row) for row in rows]
+
+
+def mark_photo_derivatives(db: Session, photo_url: str):
+    """
+    Enregistre que les variantes de la photo existent, sur tous les produits qui l'utilisent
+    (recherche par l'index GIN des photos), et valide la transaction.
+    """
+    photo = cast([photo_url], JSONB)
+    db.execute(
+        update(Product)
+        .where(Product.photos.contains(photo), ~Product.photo_derivatives.contains(photo))
+        .values(photo_derivatives=Product.photo_derivatives.op("||")(photo), updated_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+async def create_products_async(db: AsyncSession, products: list[dict]) -> None:
+    """
+    Insère plusieurs produits en une seule requête `INSERT` multi-lignes, met à jour leurs compteurs
+    et publie leurs évènements, dans la transaction en cours (session asynchrone).
+    Chaque élément contient toutes les colonnes du produit.
+    """
+    deltas: dict[StatusCountKey, int] = {}
+    for product in products:
+        key = (product["mairie_user_id"], product.get("association_user_id"), product["status"])
+        deltas[key] = deltas.get(key, 0) + 1
+
+    await db.execute(insert(Product).values(products))
+    await adjust_status_counts_async(db, deltas)
+    await notify_product_events_async(db, [product_event("created", Product(**product)) for product in products])
+
+
+def _ids_param(ids: Collection[uuid.UUID]):
+    return bindparam("ids", value=list(ids), type_=ARRAY(Uuid))
+
+
+async def update_products_status_async(
+    db: AsyncSession,
+    product_ids: Collection[uuid.UUID],
+    status: Status,
+    from_status: Status,
+) -> list[Product]:
+    """
+    Passe au status `status`, en une seule requête `UPDATE ... RETURNING`, les produits de la liste qui
+    sont au status `from_status`, met à jour leurs compteurs et publie leurs évènements dans la transaction
+    en cours (session asynchrone).
+    Retourne les produits modifiés.
+    """
+    result = await db.execute(
+        update(Product)
+        .where(Product.id == any_(_ids_param(product_ids)), Product.status == from_status)
+        .values(status=status, updated_at=datetime.now(timezone.utc))
+        .returning(Product)
+        .execution_options(synchronize_session=False)
+    )
+    products = list(result.scalars())
+
+    deltas: dict[StatusCountKey, int] = {}
+    for product in products:
+        for key, delta in (
+            ((product.mairie_user_id, product.association_user_id, from_status), -1),
+            ((product.mairie_user_id, product.association_user_id, status), 1),
+        ):
+            deltas[key] = deltas.get(key, 0) + delta
+    await adjust_status_counts_async(db, deltas)
+    await notify_product_events_async(db, [product_event("status", product) for product in products])
+    return products
+
+
+async def update_products_association_async(
+    db: AsyncSession,
+    product_ids: Collection[uuid.UUID],
+    association_user_id: uuid.UUID,
+) -> list[Product]:
+    """
+    Attribue l'association aux produits de la liste qui ne lui sont pas déjà attribués, en une seule requête
+    `UPDATE ... RETURNING`, met à jour leurs compteurs et publie leurs évènements dans la transaction
+    en cours (session asynchrone).
+    Retourne les produits modifiés.
+    """
+    # L'association précédente est lue (et la ligne verrouillée) dans la même requête, pour les compteurs
+    previous = (
+        select(Product.id, Product.association_user_id.label("previous_association_user_id"))
+        .where(
+            Product.id == any_(_ids_param(product_ids)),
+            Product.association_user_id.is_distinct_from(association_user_id),
+        )
+        .with_for_update()
+        .subquery()
+    )
+    result = await db.execute(
+        update(Product)
+        .where(Product.id == previous.c.id)
+        .values(association_user_id=association_user_id, updated_at=datetime.now(timezone.utc))
+        .returning(Product, previous.c.previous_association_user_id)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+
+    deltas: dict[StatusCountKey, int] = {}
+    for product, previous_association_user_id in rows:
+        for key, delta in (
+            ((product.mairie_user_id, previous_association_user_id, product.status), -1),
+            ((product.mairie_user_id, association_user_id, product.status), 1),
+        ):
+            deltas[key] = deltas.get(key, 0) + delta
+    await adjust_status_counts_async(db, deltas)
+    await notify_product_events_async(db, [
+        product_event("association", product, previous_association_user_id)
+        for product, previous_association_user_id in rows
+    ])
+    return [product for product, _ in rows]
@@ -1,18 +1,51 @@
 # crud/crud_user.py
 
 import uuid
+from datetime import datetime
+from typing import Iterator, Optional
+from sqlalchemy import func, tuple_
 from sqlalchemy.orm import Session
-from models.models import User, UserCreate
-from core.security import get_password_hash
+from models.models import User, UserCreate, UserPrivate
+from core.cache import TTLCache
+from core.config import settings
+from core.security import get_password_hash_async
 from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Caches des utilisateurs par ID et par email normalisé. Ils contiennent des instantanés
+# détachés de toute session et sans le hash du mot de passe : pour modifier un utilisateur,
+# le recharger avec `db.get(User, id)` ; pour vérifier un mot de passe, `get_user_credentials_async`.
+_users_by_id = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL, name="users_by_id")
+_users_by_email = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL, name="users_by_email")
+
+def _cache_user(user: User) -> User:
+    """
+    Enregistre un instantané de l'utilisateur dans les deux caches et le retourne.
+    """
+    if user is None:
+        return None
+    snapshot = User(**user.model_dump(exclude={"password"}))
+    _users_by_id.set(snapshot.id, snapshot)
+    _users_by_email.set(snapshot.email.strip().lower(), snapshot)
+    return snapshot
+
+def invalidate_cached_user(user_id: uuid.UUID):
+    """
+    Retire l'utilisateur des caches (après une création, une modification ou une suppression).
+    """
+    _users_by_id.pop(user_id)
+    _users_by_email.discard_where(lambda user: user.id == user_id)
 
 def get_user_by_email(db: Session, email: str) -> User:
     """
     Recherche un utilisateur par son adresse email (en ignorant la casse et les espaces).
     """
     normalized_email = email.strip().lower()  # Normalise l'email (supprime les espaces et met en minuscule)
-    return db.exec(select(User).where(User.email == normalized_email)).first()
+    cached = _users_by_email.get(normalized_email)
+    if cached is not None:
+        return cached
+    return _cache_user(db.exec(select(User).where(User.email == normalized_email)).first())
 
 def get_user_by_id(db: Session, user_id: uuid.UUID) -> User:
     """
@@ -21,24 +54,115 @@ def get_user_by_id(db: Session, user_id: uuid.UUID) -> User:
     if not isinstance(user_id, uuid.UUID):
         raise ValueError(f"L'ID utilisateur '{user_id}' n'est pas un UUID valide.")
     
-    return db.query(User).filter(User.id == user_id).first()
+    cached = _users_by_id.get(user_id)
+    if cached is not None:
+        return cached
+    return _cache_user(db.query(User).filter(User.id == user_id).first())
+
+def get_user_updated_at(db: Session, user_id: uuid.UUID) -> Optional[datetime]:
+    """
+    Retourne la date de dernière modification d'un utilisateur (None s'il n'existe pas), lue en base
+    sans passer par le cache ni charger l'utilisateur.
+    """
+    return db.execute(select(User.updated_at).where(User.id == user_id)).scalar()
+
+async def get_user_by_email_async(db: AsyncSession, email: str) -> User:
+    """
+    Recherche un utilisateur par son adresse email (session asynchrone).
+    """
+    normalized_email = email.strip().lower()
+    cached = _users_by_email.get(normalized_email)
+    if cached is not None:
+        return cached
+    return _cache_user((await db.exec(select(User).where(User.email == normalized_email))).first())
+
+async def get_user_credentials_async(db: AsyncSession, email: str) -> User:
+    """
+    Recherche un utilisateur par email avec le hash de son mot de passe (session asynchrone).
+    Lecture toujours faite en base : l'invalidation du cache étant propre à chaque worker,
+    un changement de mot de passe doit être pris en compte immédiatement par tous.
+    """
+    normalized_email = email.strip().lower()
+    return (await db.exec(select(User).where(User.email == normalized_email))).first()
+
+async def get_user_by_id_async(db: AsyncSession, user_id: uuid.UUID) -> User:
+    """
+    Recherche un utilisateur par son ID (session asynchrone).
+    """
+    if not isinstance(user_id, uuid.UUID):
+        raise ValueError(f"L'ID utilisateur '{user_id}' n'est pas un UUID valide.")
+
+    cached = _users_by_id.get(user_id)
+    if cached is not None:
+        return cached
+    return _cache_user(await db.get(User, user_id))
 
-def create_user(db: Session, user_create: UserCreate) -> User:
+async def create_user_async(db: AsyncSession, user_create: UserCreate) -> User:
     """
-    Crée un nouvel utilisateur dans la base de données.
+    Crée un nouvel utilisateur dans la base de données (hachage du mot de passe hors de la boucle d'évènements).
     """
-    hashed_password = get_password_hash(user_create.password)# Hachage du mot de passe
+    hashed_password = await get_password_hash_async(user_create.password)# Hachage du mot de passe
     user_create.password = hashed_password
     user_data = user_create.dict(exclude_unset=True, exclude={'deleted_at'})
     user = User(**user_data)# Crée un nouvel utilisateur
-    print(f"User: {user}")
     
     try:
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         raise ValueError(f"L'utilisateur avec cet email existe déjà: {e}")
+    invalidate_cached_user(user.id)
     
     return user
+
+def get_users_fingerprint(db: Session, *criteria) -> tuple[Optional[datetime], int]:
+    """
+    Retourne la dernière modification et le nombre des utilisateurs satisfaisant `criteria`.
+    """
+    return tuple(db.execute(select(func.max(User.updated_at), func.count()).select_from(User).where(*criteria)).one())
+
+def get_users_page(
+    db: Session,
+    *criteria,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[tuple[datetime, uuid.UUID]] = None,
+) -> list[User]:
+    """
+    Retourne une page d'utilisateurs satisfaisant `criteria`, triés par (created_at, id).
+    Avec `after` (position décodée d'un curseur), la page commence juste après cette position et `skip` est ignoré.
+    """
+    query = select(User).where(*criteria).order_by(User.created_at, User.id)
+    if after is not None:
+        query = query.where(tuple_(User.created_at, User.id) > tuple_(*after))
+    else:
+        query = query.offset(skip)
+    return db.exec(query.limit(limit)).all()
+
+def iter_user_batches(
+    db: Session,
+    *criteria,
+    after: Optional[tuple[datetime, uuid.UUID]] = None,
+    batch_size: int = settings.DB_STREAM_BATCH_SIZE,
+) -> Iterator[list[UserPrivate]]:
+    """
+    Parcourt les utilisateurs satisfaisant `criteria` par lots de `batch_size`, via un curseur côté serveur :
+    seules les colonnes publiques sont lues et aucun objet ORM n'est créé, la mémoire reste constante.
+    """
+    columns = [getattr(User, name) for name in UserPrivate.model_fields]
+    query = select(*columns).where(*criteria).order_by(User.created_at, User.id)
+    if after is not None:
+        query = query.where(tuple_(User.created_at, User.id) > tuple_(*after))
+    result = db.execute(query.execution_options(yield_per=batch_size))
+    for rows in result.mappings().partitions():
+        yield [UserPrivate.model_validate(row) for row in rows]
+
+async def get_existing_user_ids_async(db: AsyncSession, user_ids: set[uuid.UUID]) -> set[uuid.UUID]:
+    """
+    Retourne, parmi `user_ids`, les IDs des utilisateurs existants (une seule requête, session asynchrone).
+    """
+    if not user_ids:
+        return set()
+    return set((await db.exec(select(User.id).where(User.id.in_(user_ids)))).all())
@@ -1,6 +1,12 @@
 import os
 from dotenv import load_dotenv
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, create_engine, Session, Field
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from core.config import settings
+from db.migrations import run_migrations
 
 #Chargement des variables d'environnement
 load_dotenv()
@@ -14,13 +20,49 @@ POSTGRES_PORT = os.getenv('POSTGRES_PORT')
 
 #URL de connexion à la base de données
 DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+#URL de connexion asynchrone (driver asyncpg) pour les routes `async def`
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+#Paramètres du pool de connexions, communs à tous les moteurs
+ENGINE_OPTIONS = {
+    "echo": settings.DB_ECHO,
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+}
 
 #Création de la connexion à la base de données
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(DATABASE_URL, **ENGINE_OPTIONS)
+#Moteur asynchrone : les requêtes ne bloquent pas la boucle d'évènements d'uvicorn
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **ENGINE_OPTIONS)
+
+#Moteur des routes de lecture : réplica s'il est configuré, sinon la base principale
+def create_read_engine() -> Engine:
+    if settings.POSTGRES_REPLICA_URL:
+        return create_engine(settings.POSTGRES_REPLICA_URL, **ENGINE_OPTIONS)
+    return engine
+
+read_engine = create_read_engine()
 
 def create_db():
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
+#Moteur principal, pour les traitements de fond lancés par une route (hors de la session de la requête)
+def get_engine() -> Engine:
+    return engine
+
 #Création de la base de données
 def get_db():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+#Session en lecture seule pour les routes de consultation (listes, recherches)
+def get_read_db():
+    with Session(read_engine) as session:
+        yield session
+
+#Session asynchrone, à utiliser exclusivement dans les routes `async def`
+async def get_async_db():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
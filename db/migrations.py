@@ -0,0 +1,109 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Migrations versionnées appliquées après `SQLModel.metadata.create_all`.
+# `create_all` ne crée que les tables manquantes : tout changement sur une table
+# existante (index, type de colonne, données) doit être ajouté ici, à la suite,
+# sans jamais modifier une migration déjà déployée.
+MIGRATIONS = [
+    (1, "product_created_at_id_index", [
+        "CREATE INDEX IF NOT EXISTS ix_product_created_at_id ON product (created_at, id)",
+    ]),
+    (2, "product_photos_jsonb", [
+        # Conversion des listes JSON stockées en texte vers une colonne JSONB native
+        """
+        DO $$
+        BEGIN
+            IF (SELECT data_type FROM information_schema.columns
+                WHERE table_name = 'product' AND column_name = 'photos') <> 'jsonb' THEN
+                ALTER TABLE product ALTER COLUMN photos DROP DEFAULT;
+                ALTER TABLE product ALTER COLUMN photos TYPE JSONB
+                    USING COALESCE(NULLIF(btrim(photos), ''), '[]')::jsonb;
+                ALTER TABLE product ALTER COLUMN photos SET DEFAULT '[]'::jsonb;
+            END IF;
+        END $$
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_product_photos ON product USING gin (photos)",
+    ]),
+    (3, "product_search", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        # Document plein texte maintenu par Postgres : pondéré par champ, configuration française
+        """
+        ALTER TABLE product ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('french', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('french', coalesce(marque, '')), 'A') ||
+                setweight(to_tsvector('french', coalesce(description, '')), 'B') ||
+                setweight(to_tsvector('french', coalesce("productIssue", '')), 'C')
+            ) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_product_search_vector ON product USING gin (search_vector)",
+        # Recherche approchée (fautes de frappe) sur la marque et la référence
+        "CREATE INDEX IF NOT EXISTS ix_product_marque_trgm ON product USING gin (marque gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_product_reference_trgm ON product USING gin (reference gin_trgm_ops)",
+    ]),
+    (4, "productstatuscount_backfill", [
+        # Initialise les compteurs des tableaux de bord à partir des produits existants
+        """
+        INSERT INTO productstatuscount (id, mairie_user_id, association_user_id, status, count)
+        SELECT gen_random_uuid(), mairie_user_id, association_user_id, status, count(*)
+        FROM product
+        GROUP BY mairie_user_id, association_user_id, status
+        ON CONFLICT ON CONSTRAINT uq_productstatuscount_mairie_association_status
+        DO UPDATE SET count = EXCLUDED.count
+        """,
+    ]),
+    (5, "product_lookup_indexes", [
+        # Tableau de bord et listes d'une mairie, éventuellement filtrées par status
+        "CREATE INDEX IF NOT EXISTS ix_product_mairie_user_id_status ON product (mairie_user_id, status)",
+        # Clés étrangères optionnelles : les produits sans donateur ou sans association ne sont pas indexés
+        "CREATE INDEX IF NOT EXISTS ix_product_user_id ON product (user_id) WHERE user_id IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_product_association_user_id ON product (association_user_id) "
+        "WHERE association_user_id IS NOT NULL",
+        # Recherche exacte par référence (certificats)
+        "CREATE INDEX IF NOT EXISTS ix_product_reference ON product (reference)",
+    ]),
+    (6, "updated_at_indexes", [
+        # Dernière modification des listes (ETag) : lecture du maximum par l'index
+        "CREATE INDEX IF NOT EXISTS ix_product_updated_at ON product (updated_at)",
+        'CREATE INDEX IF NOT EXISTS ix_user_updated_at ON "user" (updated_at)',
+    ]),
+    (7, "user_keyset_indexes", [
+        # Pagination par curseur (created_at, id) des listes d'utilisateurs, globales ou par rôle
+        'CREATE INDEX IF NOT EXISTS ix_user_created_at_id ON "user" (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_user_role_created_at_id ON "user" (role, created_at, id)',
+    ]),
+    (8, "product_photo_derivatives", [
+        # Photos dont les variantes existent : les photos antérieures restent servies telles quelles
+        "ALTER TABLE product ADD COLUMN IF NOT EXISTS photo_derivatives JSONB NOT NULL DEFAULT '[]'::jsonb",
+    ]),
+]
+
+# Clé arbitraire du verrou consultatif qui sérialise les migrations entre workers
+MIGRATION_LOCK_KEY = 72_920_001
+
+
+def run_migrations(engine: Engine):
+    """
+    Applique, dans l'ordre, les migrations qui n'ont pas encore été enregistrées
+    dans la table `schema_migration`.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migration ("
+            "version INTEGER PRIMARY KEY, "
+            "name VARCHAR(255) NOT NULL, "
+            "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        ))
+        applied = set(conn.execute(text("SELECT version FROM schema_migration")).scalars())
+
+        for version, name, statements in MIGRATIONS:
+            if version in applied:
+                continue
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO schema_migration (version, name) VALUES (:version, :name)"),
+                {"version": version, "name": name},
+            )
@@ -1,16 +1,42 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from db.database import  create_db
+from db.database import  DATABASE_URL, create_db, engine
 from api.main import api_router
+from core.pagination import NEXT_CURSOR_HEADER
+from core.events import product_events
+from core.storage import init_storage
+from core.config import settings
+from core.certificate import shutdown_render_pool
+from workers.certificate_worker import drain_jobs
 
 origins = ['*']
 
 # Création de la base de données
 create_db()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Client du stockage objet partagé, créé une seule fois par worker
+    init_storage()
+    # Écoute des évènements produits : une seule connexion LISTEN par worker, partagée par tous les flux SSE
+    await product_events.start(DATABASE_URL)
+    # File des certificats traitée par l'API seulement si aucun worker dédié n'est déployé
+    certificate_jobs = asyncio.create_task(drain_jobs(engine)) if settings.CERTIFICATE_JOBS_IN_API else None
+    yield
+    if certificate_jobs is not None:
+        certificate_jobs.cancel()
+        with suppress(asyncio.CancelledError):
+            await certificate_jobs
+    await product_events.stop()
+    # Les processus de rendu lancés en « spawn » ne doivent pas survivre au worker
+    shutdown_render_pool()
+
 # Création de l'application FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 #Allow all CORS for staging
 #todo: make all cors available only in staging
@@ -20,6 +46,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", "Last-Modified"],
 )
 
 # Inclusion des routes de l'API
@@ -0,0 +1,7 @@
+from enum import Enum
+
+class JobStatus(str, Enum):
+  pending = "pending"
+  running = "running"
+  done = "done"
+  failed = "failed"
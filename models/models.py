@@ -1,10 +1,17 @@
 import uuid
 from datetime import datetime, timezone
+from sqlalchemy import Column, Index, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import SQLModel, Field, Relationship
-from typing import Optional, List
-from pydantic import EmailStr
+from typing import Annotated, Any, Collection, Dict, Literal, Optional, List, Union, get_args
+from pydantic import EmailStr, computed_field, model_serializer
+from pydantic import Field as PydanticField
+from pydantic.json_schema import SkipJsonSchema
 from models.role import Role
 from models.status import Status
+from models.job_status import JobStatus
+from core.config import settings
+from core.photos import derivative_url
 
 ###################################################
 ###################### USER #######################
@@ -21,6 +28,14 @@ class UserBase(SQLModel):
     deleted_at: Optional[datetime] = None
 
 class User(UserBase, table=True):
+    __table_args__ = (
+        # Dernière modification des listes d'utilisateurs (ETag)
+        Index("ix_user_updated_at", "updated_at"),
+        # Pagination par curseur des listes d'utilisateurs, globales ou par rôle
+        Index("ix_user_created_at_id", "created_at", "id"),
+        Index("ix_user_role_created_at_id", "role", "created_at", "id"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     password: str = Field(min_length=8, max_length=255)
 
@@ -88,6 +103,25 @@ class Product(ProductBase, table=True):
     Product model representing the actual product table in the database.
     Includes all the necessary fields.
     """
+    __table_args__ = (
+        # Index composite utilisé par la pagination par curseur (created_at, id)
+        Index("ix_product_created_at_id", "created_at", "id"),
+        # Index GIN pour interroger les photos côté serveur (présence, contenance)
+        Index("ix_product_photos", "photos", postgresql_using="gin"),
+        # Index de la migration 5 : listes par mairie (et status), donateur, association, référence
+        Index("ix_product_mairie_user_id_status", "mairie_user_id", "status"),
+        Index("ix_product_user_id", "user_id", postgresql_where=text("user_id IS NOT NULL")),
+        Index(
+            "ix_product_association_user_id", "association_user_id",
+            postgresql_where=text("association_user_id IS NOT NULL"),
+        ),
+        Index("ix_product_reference", "reference"),
+        # Dernière modification des listes de produits (ETag)
+        Index("ix_product_updated_at", "updated_at"),
+        # La colonne générée `search_vector` et les index trigrammes de la recherche dépendent
+        # de l'extension pg_trgm : ils sont créés par la migration 3 et ne sont pas mappés ici.
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     user_id: Optional[uuid.UUID] = Field(default=None, foreign_key="user.id", nullable=True)
     mairie_user_id: uuid.UUID = Field(foreign_key="user.id")
@@ -104,7 +138,17 @@ class Product(ProductBase, table=True):
         back_populates="association_products",
         sa_relationship_kwargs={"foreign_keys": "Product.association_user_id"}
     )
-    photos: str = Field(default="[]", nullable=False)
+    # Liste d'URLs stockée en JSONB : décodée par le driver, sans json.loads par ligne.
+    # Toute modification doit réassigner une nouvelle liste pour être détectée par l'ORM.
+    photos: List[str] = Field(
+        default_factory=list,
+        sa_column=Column(JSONB, nullable=False, server_default=text("'[]'::jsonb")),
+    )
+    # URLs des photos dont les variantes (miniature, WebP) ont été générées, renseignées par la tâche de fond
+    photo_derivatives: List[str] = Field(
+        default_factory=list,
+        sa_column=Column(JSONB, nullable=False, server_default=text("'[]'::jsonb")),
+    )
 
 class ProductCreate(SQLModel):
     """
@@ -136,6 +180,18 @@ class ProductUpdate(SQLModel):
     updated_at: Optional[datetime] = Field(default_factory=lambda: datetime.now(timezone.utc))
     photos: Optional[List[str]] = []
 
+# Élément d'une création groupée : un élément valide est lu comme `ProductCreate`, toute autre valeur est gardée
+# telle quelle (et absente du schéma) pour être signalée par son index au lieu de rejeter tout le lot.
+ProductBulkItem = Annotated[Union[ProductCreate, SkipJsonSchema[Any]], PydanticField(union_mode="left_to_right")]
+
+class ProductBulkCreate(SQLModel):
+    """
+    Bulk creation payload. Each item follows `ProductCreate` and is validated on its own,
+    so that an invalid item (including one that is not an object) is reported without rejecting the rest of the batch.
+    """
+    products: List[ProductBulkItem] = Field(min_length=1, max_length=settings.PRODUCT_BULK_MAX_ITEMS)
+
+
 class ProductUpdateStatus(SQLModel):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     status: Status
@@ -148,12 +204,193 @@ class ProductUpdatesAssociation(SQLModel):
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class ProductBatchStatusUpdate(SQLModel):
+    """Moves every listed product one step forward in its lifecycle, to `status`."""
+    ids: List[uuid.UUID] = Field(min_length=1, max_length=settings.PRODUCT_BATCH_MAX_ITEMS)
+    status: Status
+
+
+class ProductBatchAssociationUpdate(SQLModel):
+    ids: List[uuid.UUID] = Field(min_length=1, max_length=settings.PRODUCT_BATCH_MAX_ITEMS)
+    association_user_id: uuid.UUID
+
+
 class ProductId(SQLModel):
     id: uuid.UUID
     
+class ProductPhotosAttach(SQLModel):
+    """Object keys uploaded through presigned URLs, to attach to a product."""
+    object_keys: List[str] = Field(min_length=1)
+
 class ProductResponse(SQLModel):
     id: uuid.UUID
     title: str
     description: str
     reference: str
     photos: Optional[List[str]] = []
+    photo_derivatives: List[str] = Field(default=[], exclude=True)
+
+    def _derivatives(self, kind: str) -> List[str]:
+        # Tant que ses variantes ne sont pas générées, une photo est annoncée telle quelle
+        generated = set(self.photo_derivatives)
+        return [derivative_url(photo, kind) if photo in generated else photo for photo in self.photos or []]
+
+    @computed_field
+    @property
+    def thumbnails(self) -> List[str]:
+        """Bounded-size WebP thumbnails, in the same order as `photos` (the original until generated)."""
+        return self._derivatives("thumbnail")
+
+    @computed_field
+    @property
+    def photos_webp(self) -> List[str]:
+        """Full-size WebP variants, in the same order as `photos` (the original until generated)."""
+        return self._derivatives("webp")
+
+
+# Relations utilisateur pouvant être intégrées aux réponses produit via `?expand=`
+ProductExpand = Literal["user", "mairie_user", "association_user"]
+
+
+class ProductExpandedResponse(ProductResponse):
+    """
+    Product with the related users requested through `expand` embedded (`null` when unassigned);
+    relations that were not requested are omitted.
+    """
+    user: Optional[UserPrivate] = None
+    mairie_user: Optional[UserPrivate] = None
+    association_user: Optional[UserPrivate] = None
+
+    @classmethod
+    def from_product(cls, product: "Product", expand: Collection[str]) -> "ProductExpandedResponse":
+        """Builds the response of `product`, reading only the relations listed in `expand`."""
+        fields = {name: getattr(product, name) for name in ProductResponse.model_fields}
+        fields.update({relation: getattr(product, relation) for relation in expand})
+        return cls.model_validate(fields)
+
+    @model_serializer(mode="wrap")
+    def _omit_unexpanded(self, handler):
+        data = handler(self)
+        for relation in set(get_args(ProductExpand)) - self.model_fields_set:
+            data.pop(relation, None)
+        return data
+
+
+class ProductStatusCount(SQLModel, table=True):
+    """
+    Number of products per (mairie, association, status), kept up to date by the product routes
+    so that dashboards don't have to scan every product of a mairie.
+    """
+    __table_args__ = (
+        # Les produits sans association sont comptés sur la ligne association_user_id = NULL (NULLS NOT DISTINCT : PostgreSQL 15+)
+        UniqueConstraint(
+            "mairie_user_id", "association_user_id", "status",
+            name="uq_productstatuscount_mairie_association_status",
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    mairie_user_id: uuid.UUID = Field(foreign_key="user.id")
+    association_user_id: Optional[uuid.UUID] = Field(default=None, foreign_key="user.id", nullable=True)
+    status: Status
+    count: int = 0
+
+
+class AssociationStatusStats(SQLModel):
+    association_user_id: Optional[uuid.UUID] = None
+    total: int
+    by_status: dict[Status, int]
+
+
+class MairieStatusStats(SQLModel):
+    mairie_user_id: uuid.UUID
+    total: int
+    by_status: dict[Status, int]
+    associations: List[AssociationStatusStats]
+
+
+class ProductBulkError(SQLModel):
+    index: int
+    detail: Any
+
+
+class ProductBulkResult(SQLModel):
+    created: List[ProductResponse]
+    errors: List[ProductBulkError]
+
+
+class ProductBatchUpdateResult(SQLModel):
+    """Changed products, and the ids left untouched (unknown, or not eligible for the change)."""
+    updated: List[ProductResponse]
+    skipped: List[uuid.UUID]
+
+
+################################################
+####################Uploads#####################
+################################################
+
+class PresignedUploadRequest(SQLModel):
+    filename: str = Field(min_length=1, max_length=255)
+    content_type: Optional[str] = None
+
+
+class PresignedUploadResponse(SQLModel):
+    url: str
+    fields: Dict[str, str]
+    object_key: str
+    expires_in: int
+
+
+################################################
+##################Certificates##################
+################################################
+
+class CertificateBatchRequest(SQLModel):
+    """
+    Batch certificate generation: either every product of a mairie
+    or an explicit list of product references.
+    Only products attached to an association are certified.
+    """
+    mairie_id: Optional[uuid.UUID] = None
+    product_references: Optional[List[str]] = None
+    output: Literal["pdf", "zip"] = "zip"
+
+
+class CertificateJob(SQLModel, table=True):
+    """
+    Certificate generation job, queued by `POST /format/generate_pdf/`
+    and processed by the workers in `workers/certificate_worker.py`.
+    """
+    __table_args__ = (
+        # Index utilisé par les workers pour réserver le prochain job en attente
+        Index("ix_certificatejob_status_run_after", "status", "run_after"),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    mairie_user_id: uuid.UUID = Field(foreign_key="user.id")
+    association_user_id: uuid.UUID = Field(foreign_key="user.id")
+    product_reference: str = Field(max_length=255)
+    status: JobStatus = JobStatus.pending
+    progress: int = 0
+    attempts: int = 0
+    max_attempts: int = 3
+    error: Optional[str] = None
+    file_path: Optional[str] = Field(default=None, max_length=255)
+    run_after: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class CertificateJobResponse(SQLModel):
+    id: uuid.UUID
+    product_reference: str
+    status: JobStatus
+    progress: int
+    attempts: int
+    error: Optional[str] = None
+    file_path: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
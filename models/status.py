@@ -1,3 +1,4 @@
+from typing import Optional
 from enum import Enum
 
 class Status(str, Enum):
@@ -7,4 +8,13 @@ class Status(str, Enum):
   reconditioning = "en reconditionement"
   reconditionedAwaitingRecipient = "reconditioné en attende de receveur"
   delivered = "délivrer au receveur"
-  
\ No newline at end of file
+  
+
+def previous_status(status: Status) -> Optional[Status]:
+  """
+  Status qu'un produit doit avoir pour passer à `status` lors d'un changement groupé :
+  le cycle de vie avance d'une étape à la fois, dans l'ordre de déclaration. None pour le status initial.
+  """
+  order = list(Status)
+  index = order.index(status)
+  return order[index - 1] if index > 0 else None
@@ -0,0 +1,91 @@
+import time
+import uuid
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event
+
+from api import auth
+from core.config import settings
+from core.security import create_access_token
+from tests.conftest import engine
+
+
+@pytest.fixture()
+def token_cache():
+    """Start from an empty verified-token cache and return it."""
+    auth._token_cache.clear()
+    yield auth._token_cache
+    auth._token_cache.clear()
+
+
+@pytest.fixture()
+def user_queries():
+    """Record the queries on the user table sent by the sync engine (the one get_current_user uses)."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM "user"' in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    yield statements
+    event.remove(engine, "before_cursor_execute", capture)
+
+
+@pytest.fixture()
+def registered_user(test_client, user_particulier_payload):
+    """Create a user and return (id, bearer headers)."""
+    user_id = test_client.post("/api/v1/users/", json=user_particulier_payload).json()["id"]
+    token = test_client.post("/api/v1/users/token", data={
+        "username": user_particulier_payload["email"],
+        "password": user_particulier_payload["password"],
+    }).json()["access_token"]
+    return uuid.UUID(user_id), {"Authorization": f"Bearer {token}"}
+
+
+def test_cached_token_skips_decode_and_database(test_client, token_cache, user_queries, registered_user, monkeypatch):
+    user_id, headers = registered_user
+    assert test_client.get("/api/v1/users/me", headers=headers).status_code == 200
+    assert len(user_queries) == 1
+
+    def fail_decode(token):
+        raise AssertionError("a cached token must not be decoded again")
+
+    monkeypatch.setattr(auth, "decode_access_token", fail_decode)
+    response = test_client.get("/api/v1/users/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["id"] == str(user_id)
+    assert len(user_queries) == 1
+
+
+def test_cached_token_expires_with_the_token(test_client, token_cache, registered_user):
+    user_id, _ = registered_user
+    token = create_access_token(subject=user_id, expires_delta=timedelta(seconds=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    assert test_client.get("/api/v1/users/me", headers=headers).status_code == 200
+
+    # `exp` is truncated to the second: wait until it is strictly in the past
+    time.sleep(2.1)
+    assert test_client.get("/api/v1/users/me", headers=headers).status_code in (401, 403)
+
+
+def test_cached_token_lifetime_is_bounded(test_client, token_cache, registered_user, monkeypatch):
+    _, headers = registered_user
+    monkeypatch.setattr(settings, "USER_CACHE_TTL", 0)
+    test_client.get("/api/v1/users/me", headers=headers)
+    misses = token_cache.stats()["misses"]
+    test_client.get("/api/v1/users/me", headers=headers)
+    assert token_cache.stats()["misses"] == misses + 1
+
+
+def test_cached_token_invalidated_on_update_and_delete(test_client, token_cache, registered_user):
+    _, headers = registered_user
+    assert test_client.get("/api/v1/users/me", headers=headers).json()["prenom"] != "updated"
+
+    assert test_client.put("/api/v1/users/me", json={"prenom": "updated"}, headers=headers).status_code == 200
+    assert test_client.get("/api/v1/users/me", headers=headers).json()["prenom"] == "updated"
+
+    assert test_client.delete("/api/v1/users/me", headers=headers).status_code == 200
+    assert token_cache.stats()["size"] == 0
+    assert test_client.get("/api/v1/users/me", headers=headers).status_code == 404
@@ -0,0 +1,122 @@
+import asyncio
+import uuid
+
+import asyncpg
+
+from core import events
+from core.config import settings
+from core.events import ProductEventBroker
+from tests.conftest import DATABASE_URL
+
+
+def test_product_events_feed_requires_a_filter(test_client):
+    response = test_client.get("/api/v1/products/events")
+    assert response.status_code == 422
+
+
+def test_product_events_are_dispatched_to_matching_subscribers(
+    test_client, product_payload, mairie_user_id, association_user_id
+):
+    async def next_event(subscription):
+        return await asyncio.wait_for(subscription.queue.get(), timeout=5)
+
+    async def scenario():
+        broker = ProductEventBroker()
+        await broker.start(DATABASE_URL)
+        try:
+            await asyncio.wait_for(broker.connected.wait(), timeout=5)
+            with broker.subscribe(mairie_user_id=uuid.UUID(mairie_user_id)) as mairie, \
+                    broker.subscribe(association_user_id=uuid.UUID(association_user_id)) as association, \
+                    broker.subscribe(mairie_user_id=uuid.uuid4()) as other_mairie:
+                # The API runs in the test client's own thread; keep this loop free to receive notifications
+                response = await asyncio.to_thread(test_client.post, "/api/v1/products/", json=product_payload)
+                product_id = response.json()["product"]["id"]
+                for _ in range(2):  # the second call changes nothing and must not publish
+                    await asyncio.to_thread(
+                        test_client.put,
+                        f"/api/v1/products/{product_id}/association",
+                        json={"id": product_id, "association_user_id": association_user_id},
+                    )
+                await asyncio.to_thread(
+                    test_client.put,
+                    f"/api/v1/products/{product_id}/status",
+                    json={"id": product_id, "status": product_payload["status"]},
+                )
+                await asyncio.to_thread(test_client.delete, f"/api/v1/products/{product_id}")
+
+                events = [await next_event(mairie) for _ in range(3)]
+                assert [event["type"] for event in events] == ["created", "association", "deleted"]
+                assert all(event["product_id"] == product_id for event in events)
+
+                assert [(await next_event(association))["type"] for _ in range(2)] == ["association", "deleted"]
+                assert mairie.queue.empty() and association.queue.empty()
+                assert other_mairie.queue.empty()
+        finally:
+            await broker.stop()
+
+    asyncio.run(scenario())
+
+
+class FakeConnection:
+    """Stand-in for an asyncpg connection that fails the way a dropped or half-open one does."""
+
+    def __init__(self, fail_listen=False, hang=False):
+        self.fail_listen = fail_listen
+        self.hang = hang
+        self.closed = False
+
+    def add_termination_listener(self, callback):
+        pass
+
+    async def add_listener(self, channel, callback):
+        if self.fail_listen:
+            raise asyncpg.InterfaceError("connection is closed")
+
+    async def execute(self, query):
+        if self.hang:
+            await asyncio.sleep(3600)
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self, timeout=None):
+        self.closed = True
+
+
+def run_broker_with(monkeypatch, connections):
+    """Start a broker on fake connections and wait until it listens on the last one."""
+    monkeypatch.setattr(settings, "EVENTS_RECONNECT_DELAY", 0.01)
+    monkeypatch.setattr(settings, "EVENTS_HEARTBEAT", 0.05)
+    monkeypatch.setattr(settings, "EVENTS_LIVENESS_TIMEOUT", 0.05)
+    pending = list(connections)
+
+    async def connect(dsn):
+        return pending.pop(0)
+
+    monkeypatch.setattr(events.asyncpg, "connect", connect)
+
+    async def scenario():
+        broker = ProductEventBroker()
+        await broker.start("postgresql://unused")
+        try:
+            for _ in range(100):
+                if not pending and broker.connected.is_set():
+                    return True
+                await asyncio.sleep(0.02)
+            return False
+        finally:
+            await broker.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_broker_retries_when_listen_fails(monkeypatch):
+    failing, healthy = FakeConnection(fail_listen=True), FakeConnection()
+    assert run_broker_with(monkeypatch, [failing, healthy])
+    assert failing.closed
+
+
+def test_broker_reconnects_when_liveness_check_times_out(monkeypatch):
+    half_open, healthy = FakeConnection(hang=True), FakeConnection()
+    assert run_broker_with(monkeypatch, [half_open, healthy])
+    assert half_open.closed
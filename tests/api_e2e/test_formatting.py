@@ -0,0 +1,123 @@
+import asyncio
+import io
+import uuid
+import zipfile
+
+from sqlalchemy import text
+
+from core.config import settings
+from crud.crud_job import get_job_by_id
+from models.job_status import JobStatus
+from workers.certificate_worker import drain_jobs, process_next_job
+
+
+def create_product_with_association(test_client, product_payload, association_user_id):
+    response = test_client.post("/api/v1/products/", json=product_payload)
+    assert response.status_code == 201
+    product = response.json()["product"]
+    response = test_client.put(
+        f"/api/v1/products/{product['id']}/association",
+        json={"id": product["id"], "association_user_id": association_user_id},
+    )
+    assert response.status_code == 200
+    return product
+
+
+def test_generate_pdf_batch(test_client, product_payload, association_user_id, mairie_user_id):
+    references = {
+        create_product_with_association(test_client, product_payload, association_user_id)["reference"]
+        for _ in range(3)
+    }
+
+    response = test_client.post("/api/v1/format/generate_pdf/batch", json={"mairie_id": mairie_user_id})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert set(archive.namelist()) == {f"{reference}.pdf" for reference in references}
+
+    response = test_client.post("/api/v1/format/generate_pdf/batch", json={
+        "product_references": sorted(references),
+        "output": "pdf",
+    })
+    assert response.status_code == 200
+    assert response.content.startswith(b"%PDF")
+
+
+def test_generate_pdf_job(test_client, db_session, product_payload, association_user_id, mairie_user_id, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CERTIFICATE_DIR", str(tmp_path))
+    product = create_product_with_association(test_client, product_payload, association_user_id)
+
+    response = test_client.post("/api/v1/format/generate_pdf/", params={
+        "mairie_id": mairie_user_id,
+        "association_id": association_user_id,
+        "product_reference": product["reference"],
+    })
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "pending"
+
+    # Run one worker iteration in-process
+    assert process_next_job(db_session.get_bind())
+    assert not process_next_job(db_session.get_bind())
+
+    response = test_client.get(f"/api/v1/format/jobs/{job['id']}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "done"
+    assert response.json()["progress"] == 100
+
+    response = test_client.get(f"/api/v1/format/get_pdf/{product['reference']}")
+    assert response.status_code == 200
+    assert response.content.startswith(b"%PDF")
+
+
+def test_stale_job_on_last_attempt_is_failed(test_client, db_session, product_payload, association_user_id, mairie_user_id):
+    product = create_product_with_association(test_client, product_payload, association_user_id)
+    response = test_client.post("/api/v1/format/generate_pdf/", params={
+        "mairie_id": mairie_user_id,
+        "association_id": association_user_id,
+        "product_reference": product["reference"],
+    })
+    job_id = uuid.UUID(response.json()["id"])
+    # Worker lost while running the last attempt
+    db_session.execute(
+        text("""
+            UPDATE certificatejob
+            SET status = 'running', attempts = max_attempts, updated_at = now() - interval '1 day'
+            WHERE id = :id
+        """),
+        {"id": job_id},
+    )
+    db_session.commit()
+
+    assert not process_next_job(db_session.get_bind())
+    db_session.expire_all()
+    job = get_job_by_id(db_session, job_id)
+    assert job.status == JobStatus.failed
+    assert job.finished_at is not None
+
+
+def test_drain_jobs_processes_queue(test_client, db_session, product_payload, association_user_id, mairie_user_id, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CERTIFICATE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "JOB_POLL_INTERVAL", 0.05)
+    product = create_product_with_association(test_client, product_payload, association_user_id)
+    response = test_client.post("/api/v1/format/generate_pdf/", params={
+        "mairie_id": mairie_user_id,
+        "association_id": association_user_id,
+        "product_reference": product["reference"],
+    })
+    job_id = uuid.UUID(response.json()["id"])
+
+    async def drain_until_done():
+        task = asyncio.create_task(drain_jobs(db_session.get_bind()))
+        try:
+            for _ in range(100):
+                db_session.expire_all()
+                if get_job_by_id(db_session, job_id).status == JobStatus.done:
+                    return True
+                await asyncio.sleep(0.05)
+            return False
+        finally:
+            task.cancel()
+
+    assert asyncio.run(drain_until_done())
+    assert (tmp_path / f"{product['reference']}.pdf").exists()
@@ -0,0 +1,303 @@
+import csv
+import io
+import json
+import pytest
+from sqlalchemy import event, text
+
+from core.config import settings
+from tests.conftest import engine
+
+
+def test_products_cursor_pagination(test_client, product_payload):
+    created_ids = set()
+    for _ in range(3):
+        response = test_client.post("/api/v1/products/", json=product_payload)
+        assert response.status_code == 201
+        created_ids.add(response.json()["product"]["id"])
+
+    # Walk every page following the cursor returned by the API
+    seen_ids = []
+    response = test_client.get("/api/v1/products/", params={"limit": 2})
+    while True:
+        assert response.status_code == 200
+        seen_ids.extend(product["id"] for product in response.json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if next_cursor is None:
+            break
+        response = test_client.get("/api/v1/products/", params={"limit": 2, "cursor": next_cursor})
+
+    assert len(seen_ids) == len(set(seen_ids))
+    assert created_ids <= set(seen_ids)
+
+
+def test_products_invalid_cursor(test_client):
+    response = test_client.get("/api/v1/products/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_products_search(test_client, product_payload):
+    laptop = test_client.post("/api/v1/products/", json=product_payload).json()["product"]
+    desktop = test_client.post(
+        "/api/v1/products/",
+        json={**product_payload, "title": "Unité centrale", "marque": "Dell", "productIssue": "Disque dur en panne"},
+    ).json()["product"]
+
+    # Full-text match on the French stem ("ordinateurs" -> "ordin")
+    response = test_client.get("/api/v1/products/search", params={"q": "ordinateurs portables"})
+    assert response.status_code == 200
+    assert [product["id"] for product in response.json()] == [laptop["id"]]
+
+    # Typo-tolerant brand match
+    response = test_client.get("/api/v1/products/search", params={"q": "Lenovvo"})
+    assert [product["id"] for product in response.json()] == [laptop["id"]]
+
+    # Typo-tolerant reference match
+    response = test_client.get("/api/v1/products/search", params={"q": desktop["reference"][:-1]})
+    assert response.json()[0]["id"] == desktop["id"]
+
+    response = test_client.get("/api/v1/products/search", params={"q": ""})
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("route, query", [("/api/v1/products/", {}), ("/api/v1/products/search", {"q": "ordinateur"})])
+@pytest.mark.parametrize("params", [
+    {"limit": settings.PAGE_MAX_SIZE + 1},
+    {"limit": 0},
+    {"limit": -1},
+    {"skip": -1},
+])
+def test_product_list_rejects_out_of_range_paging(test_client, route, query, params):
+    assert test_client.get(route, params={**query, **params}).status_code == 422
+
+
+def test_mairie_stats_follow_product_changes(test_client, product_payload, mairie_user_id, association_user_id):
+    products = [test_client.post("/api/v1/products/", json=product_payload).json()["product"] for _ in range(3)]
+
+    response = test_client.put(
+        f"/api/v1/products/{products[0]['id']}/association",
+        json={"id": products[0]["id"], "association_user_id": association_user_id},
+    )
+    assert response.status_code == 200
+    response = test_client.put(
+        f"/api/v1/products/{products[0]['id']}/status",
+        json={"id": products[0]["id"], "status": "receptione dans l'asso"},
+    )
+    assert response.status_code == 200
+    assert test_client.delete(f"/api/v1/products/{products[1]['id']}").status_code == 200
+
+    response = test_client.get(f"/api/v1/products/mairie/{mairie_user_id}/stats")
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["total"] == 2
+    assert stats["by_status"]["requete de dons"] == 1
+    assert stats["by_status"]["receptione dans l'asso"] == 1
+    assert stats["by_status"]["délivrer au receveur"] == 0
+
+    by_association = {entry["association_user_id"]: entry for entry in stats["associations"]}
+    assert by_association[association_user_id]["total"] == 1
+    assert by_association[association_user_id]["by_status"]["receptione dans l'asso"] == 1
+    assert by_association[None]["by_status"]["requete de dons"] == 1
+
+
+def test_products_expand_related_users(test_client, product_payload, mairie_user_id, association_user_id):
+    product_ids = []
+    for _ in range(4):
+        product = test_client.post("/api/v1/products/", json=product_payload).json()["product"]
+        test_client.put(
+            f"/api/v1/products/{product['id']}/association",
+            json={"id": product["id"], "association_user_id": association_user_id},
+        )
+        product_ids.append(product["id"])
+
+    # Without expand, related users are not embedded
+    response = test_client.get(f"/api/v1/products/{product_ids[0]}")
+    assert response.status_code == 200
+    assert "mairie_user" not in response.json()
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = test_client.get(
+            f"/api/v1/products/mairie/{mairie_user_id}",
+            params={"expand": ["mairie_user", "association_user"]},
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    products = response.json()
+    assert len(products) == 4
+    for product in products:
+        assert product["mairie_user"]["id"] == mairie_user_id
+        assert product["association_user"]["id"] == association_user_id
+        assert "password" not in product["mairie_user"]
+        assert "user" not in product
+    # Mairie lookup, ETag fingerprints, product page, then one batched query per expanded relationship
+    assert len(statements) <= 6
+
+    response = test_client.get(f"/api/v1/products/{product_ids[0]}", params={"expand": "association_user"})
+    assert response.json()["association_user"]["id"] == association_user_id
+    # Null fields of embedded users are kept
+    assert response.json()["association_user"]["deleted_at"] is None
+
+    # A requested relation that is not assigned yet is returned as null
+    unassigned = test_client.post("/api/v1/products/", json=product_payload).json()["product"]
+    response = test_client.get(f"/api/v1/products/{unassigned['id']}", params={"expand": "association_user"})
+    assert response.json()["association_user"] is None
+    assert "mairie_user" not in response.json()
+
+    response = test_client.get("/api/v1/products/", params={"expand": "unknown"})
+    assert response.status_code == 422
+
+
+def test_product_conditional_get(test_client, product_payload, mairie_user_id):
+    product = test_client.post("/api/v1/products/", json=product_payload).json()["product"]
+    url = f"/api/v1/products/{product['id']}"
+
+    response = test_client.get(url)
+    assert response.status_code == 200
+    etag, last_modified = response.headers["ETag"], response.headers["Last-Modified"]
+
+    assert test_client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert test_client.get(url, headers={"If-Modified-Since": last_modified}).status_code == 304
+    # Another representation of the same product has its own ETag
+    assert test_client.get(url, params={"expand": "mairie_user"}, headers={"If-None-Match": etag}).status_code == 200
+
+    list_url = f"/api/v1/products/mairie/{mairie_user_id}"
+    list_etag = test_client.get(list_url).headers["ETag"]
+    assert test_client.get(list_url, headers={"If-None-Match": list_etag}).status_code == 304
+
+    test_client.put(f"{url}/status", json={"id": product["id"], "status": "reçu en mairie"})
+
+    response = test_client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert test_client.get(list_url, headers={"If-None-Match": list_etag}).status_code == 200
+
+    # Deleting a product changes the list fingerprint even though no updated_at moves forward
+    other = test_client.post("/api/v1/products/", json=product_payload).json()["product"]
+    list_etag = test_client.get(list_url).headers["ETag"]
+    test_client.delete(f"/api/v1/products/{other['id']}")
+    assert test_client.get(list_url, headers={"If-None-Match": list_etag}).status_code == 200
+
+
+def test_expanded_etag_tracks_only_embedded_users(test_client, db_session, product_payload, mairie_user_id, association_user_id, user_particulier_payload):
+    product = test_client.post("/api/v1/products/", json=product_payload).json()["product"]
+    unrelated_id = test_client.post("/api/v1/users/", json=user_particulier_payload).json()["id"]
+
+    def touch(user_id):
+        db_session.execute(text('UPDATE "user" SET updated_at = now() WHERE id = :id'), {"id": user_id})
+        db_session.commit()
+
+    for url in (
+        f"/api/v1/products/{product['id']}?expand=mairie_user",
+        f"/api/v1/products/mairie/{mairie_user_id}?expand=mairie_user",
+        "/api/v1/products/?expand=mairie_user",
+    ):
+        etag = test_client.get(url).headers["ETag"]
+        touch(unrelated_id)
+        touch(association_user_id)
+        assert test_client.get(url, headers={"If-None-Match": etag}).status_code == 304, url
+        touch(mairie_user_id)
+        assert test_client.get(url, headers={"If-None-Match": etag}).status_code == 200, url
+
+
+def test_export_mairie_products(test_client, product_payload, mairie_user_id, association_user_id):
+    product_ids = [test_client.post("/api/v1/products/", json=product_payload).json()["product"]["id"] for _ in range(3)]
+    test_client.put(
+        f"/api/v1/products/{product_ids[0]}/association",
+        json={"id": product_ids[0], "association_user_id": association_user_id},
+    )
+
+    response = test_client.get(f"/api/v1/products/mairie/{mairie_user_id}/export", params={"with_names": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["id"] for row in rows] == product_ids
+    assert rows[0]["association_nom"] == "Association"
+    assert rows[1]["association_user_id"] == ""
+    assert rows[0]["status"] == "requete de dons"
+    assert rows[0]["photos"] == "[]"
+
+    response = test_client.get(f"/api/v1/products/mairie/{mairie_user_id}/export", params={"format": "ndjson"})
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == product_ids
+    assert rows[0]["association_user_id"] == association_user_id
+    assert "association_nom" not in rows[0]
+    assert "search_vector" not in rows[0]
+
+
+def test_bulk_create_products(test_client, product_payload, mairie_user_id):
+    unknown_mairie = {**product_payload, "mairie_user_id": "00000000-0000-0000-0000-000000000000"}
+    invalid = {**product_payload, "status": "not-a-status"}
+    response = test_client.post(
+        "/api/v1/products/bulk",
+        json={"products": [product_payload, invalid, product_payload, unknown_mairie, 42]},
+    )
+    assert response.status_code == 201
+    result = response.json()
+    assert len(result["created"]) == 2
+    assert len({product["reference"] for product in result["created"]}) == 2
+    assert [error["index"] for error in result["errors"]] == [1, 3, 4]
+    assert result["errors"][1]["detail"] == "Mairie utilisateur non trouvé."
+    # An item that is not an object is reported like any other invalid item
+    assert result["errors"][2]["detail"] == "L'élément doit être un objet."
+
+    response = test_client.get(f"/api/v1/products/mairie/{mairie_user_id}")
+    assert {product["id"] for product in response.json()} == {product["id"] for product in result["created"]}
+    stats = test_client.get(f"/api/v1/products/mairie/{mairie_user_id}/stats").json()
+    assert stats["by_status"]["requete de dons"] == 2
+
+    response = test_client.post("/api/v1/products/bulk", json={"products": [invalid]})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["index"] == 0
+
+    assert test_client.post("/api/v1/products/bulk", json={"products": []}).status_code == 422
+
+
+def test_bulk_create_documents_item_schema(test_client):
+    schemas = test_client.get("/openapi.json").json()["components"]["schemas"]
+    assert schemas["ProductBulkCreate"]["properties"]["products"]["items"] == {"$ref": "#/components/schemas/ProductCreate"}
+
+
+def test_batch_status_and_association(test_client, product_payload, mairie_user_id, association_user_id):
+    created = test_client.post(
+        "/api/v1/products/bulk", json={"products": [product_payload] * 3}
+    ).json()["created"]
+    ids = [product["id"] for product in created]
+    unknown_id = "00000000-0000-0000-0000-000000000000"
+
+    response = test_client.put(
+        "/api/v1/products/batch/status", json={"ids": ids[:2] + [unknown_id], "status": "reçu en mairie"}
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert {product["id"] for product in result["updated"]} == set(ids[:2])
+    assert result["skipped"] == [unknown_id]
+
+    # Skipping a lifecycle step is refused: only products at the previous step move forward
+    response = test_client.put(
+        "/api/v1/products/batch/status", json={"ids": ids, "status": "receptione dans l'asso"}
+    )
+    assert response.json()["skipped"] == [ids[2]]
+    response = test_client.put("/api/v1/products/batch/status", json={"ids": ids, "status": "requete de dons"})
+    assert response.status_code == 422
+
+    response = test_client.put(
+        "/api/v1/products/batch/association", json={"ids": ids[1:], "association_user_id": association_user_id}
+    )
+    assert response.status_code == 200
+    assert {product["id"] for product in response.json()["updated"]} == set(ids[1:])
+    response = test_client.put(
+        "/api/v1/products/batch/association", json={"ids": ids, "association_user_id": association_user_id}
+    )
+    assert {product["id"] for product in response.json()["updated"]} == {ids[0]}
+
+    stats = test_client.get(f"/api/v1/products/mairie/{mairie_user_id}/stats").json()
+    assert stats["by_status"]["receptione dans l'asso"] == 2
+    assert stats["by_status"]["requete de dons"] == 1
+    by_association = {entry["association_user_id"]: entry for entry in stats["associations"]}
+    assert by_association[association_user_id]["total"] == 3
+    assert None not in by_association
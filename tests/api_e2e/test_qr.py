@@ -0,0 +1,52 @@
+from sqlalchemy import text
+
+from api.routes.qr import _qr_cache, qr_fingerprint, qr_product_url
+from core.config import settings
+
+
+def test_qr_code_conditional_get(test_client, product_payload):
+    response = test_client.post("/api/v1/products/", json=product_payload)
+    product_id = response.json()["product"]["id"]
+
+    response = test_client.get(f"/api/v1/qr/{product_id}/generate-qr-code")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    etag = response.headers["etag"]
+
+    response = test_client.get(f"/api/v1/qr/{product_id}/generate-qr-code", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = test_client.get(f"/api/v1/qr/{product_id}/generate-qr-code", params={"format": "svg"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/svg+xml"
+    assert response.headers["etag"] != etag
+
+
+def test_qr_code_of_deleted_product(test_client, product_payload, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "QR_CACHE_DIR", str(tmp_path))
+    product_id = test_client.post("/api/v1/products/", json=product_payload).json()["product"]["id"]
+    url = f"/api/v1/qr/{product_id}/generate-qr-code"
+
+    etag = test_client.get(url).headers["etag"]
+    fingerprint = qr_fingerprint(qr_product_url(product_id), "png")
+    assert _qr_cache.get(fingerprint) is not None
+    assert list(tmp_path.iterdir())
+
+    assert test_client.delete(f"/api/v1/products/{product_id}").status_code == 200
+    assert _qr_cache.get(fingerprint) is None
+    assert not list(tmp_path.iterdir())
+
+    assert test_client.get(url).status_code == 404
+    assert test_client.get(url, headers={"If-None-Match": etag}).status_code == 404
+
+
+def test_qr_code_checks_existence_before_serving_cache(test_client, db_session, product_payload):
+    product_id = test_client.post("/api/v1/products/", json=product_payload).json()["product"]["id"]
+    url = f"/api/v1/qr/{product_id}/generate-qr-code"
+    etag = test_client.get(url).headers["etag"]
+
+    # Deleted behind this worker's back: its cache still holds the QR code
+    db_session.execute(text("DELETE FROM product WHERE id = :id"), {"id": product_id})
+    db_session.commit()
+    assert test_client.get(url).status_code == 404
+    assert test_client.get(url, headers={"If-None-Match": etag}).status_code == 404
@@ -0,0 +1,163 @@
+"""
+Query-plan regression tests: every product query issued by the routes below is
+re-run under EXPLAIN against a seeded, analyzed database, and must not fall back
+to a sequential scan of the product table.
+"""
+import json
+import re
+import uuid
+
+import pytest
+from sqlalchemy import event, text
+
+from core.pagination import encode_cursor
+from models.status import Status
+from tests.conftest import async_engine, engine
+
+MAIRIES = 200
+ASSOCIATIONS = 500
+PARTICULIERS = 1000
+PRODUCTS = 20_000
+
+
+@pytest.fixture()
+def seeded_db(db_session):
+    """
+    Seed a realistic volume of users and products, then ANALYZE so that the
+    planner picks the same plans it would in production.
+    """
+    users = {
+        role: [uuid.uuid4() for _ in range(count)]
+        for role, count in (("mairie", MAIRIES), ("association", ASSOCIATIONS), ("particulier", PARTICULIERS))
+    }
+    with engine.begin() as connection:
+        for role, ids in users.items():
+            connection.execute(
+                text("""
+                    INSERT INTO "user" (id, nom, prenom, email, telephone, role, password, created_at, updated_at)
+                    SELECT id, 'Seed', CAST(:role AS text), CAST(:role AS text) || '-' || id || '@example.org',
+                           '0100000000', CAST(:role AS role), 'not-a-hash', now(), now()
+                    FROM unnest(CAST(:ids AS uuid[])) AS id
+                """),
+                {"role": role, "ids": ids},
+            )
+        connection.execute(
+            text("""
+                INSERT INTO product (id, title, description, "productIssue", reference, marque, status,
+                                     created_at, updated_at, mairie_user_id, association_user_id, user_id)
+                SELECT gen_random_uuid(), 'Ordinateur ' || i, 'Produit de test', 'Aucun', 'SEED-' || i, 'Lenovo',
+                       CAST((CAST(:statuses AS text[]))[1 + i % 6] AS status),
+                       now() - i * interval '1 minute', now(),
+                       (CAST(:mairies AS uuid[]))[1 + i % :mairie_count],
+                       CASE WHEN i % 2 = 0 THEN (CAST(:associations AS uuid[]))[1 + i % :association_count] END,
+                       CASE WHEN i % 4 = 0 THEN (CAST(:particuliers AS uuid[]))[1 + i % :particulier_count] END
+                FROM generate_series(1, :products) AS i
+            """),
+            {
+                "statuses": [status.name for status in Status],
+                "mairies": users["mairie"],
+                "associations": users["association"],
+                "particuliers": users["particulier"],
+                "mairie_count": MAIRIES,
+                "association_count": ASSOCIATIONS,
+                "particulier_count": PARTICULIERS,
+                "products": PRODUCTS,
+            },
+        )
+        connection.execute(text('ANALYZE "user", product'))
+
+        product = connection.execute(
+            text("SELECT id, reference, created_at FROM product WHERE association_user_id IS NOT NULL LIMIT 1")
+        ).one()
+
+    return {
+        "mairie_id": users["mairie"][0],
+        "association_id": users["association"][0],
+        "user_id": users["particulier"][0],
+        "product_id": product.id,
+        "product_reference": product.reference,
+        "cursor": encode_cursor(product.created_at, product.id),
+    }
+
+
+@pytest.fixture()
+def captured_selects():
+    """Record every SELECT sent by the sync and async engines, with its parameters."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((conn.dialect.driver, statement, parameters))
+
+    targets = (engine, async_engine.sync_engine)
+    for target in targets:
+        event.listen(target, "before_cursor_execute", capture)
+    yield statements
+    for target in targets:
+        event.remove(target, "before_cursor_execute", capture)
+
+
+def _to_psycopg(driver, statement, parameters):
+    """Rewrite an asyncpg statement ($1, $2...) to the psycopg paramstyle so it can be explained here."""
+    if driver != "asyncpg":
+        return statement, parameters
+    statement = re.sub(r"\$(\d+)", r"%(p\1)s", statement.replace("%", "%%"))
+    return statement, {f"p{index}": value for index, value in enumerate(parameters, start=1)}
+
+
+def _seq_scanned_relations(plan: dict) -> set[str]:
+    relations = set()
+    if plan["Node Type"] == "Seq Scan":
+        relations.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        relations |= _seq_scanned_relations(child)
+    return relations
+
+
+def _fill(value, ids):
+    """Substitute the seeded ids into a JSON payload template."""
+    if isinstance(value, list):
+        return [_fill(item, ids) for item in value]
+    return value.format(**ids) if isinstance(value, str) else value
+
+
+ROUTES = [
+    ("get", "/api/v1/products/{product_id}", None),
+    ("get", "/api/v1/products/?limit=10", None),
+    ("get", "/api/v1/products/?limit=10&cursor={cursor}", None),
+    ("get", "/api/v1/products/?limit=10&expand=mairie_user&expand=association_user", None),
+    ("get", "/api/v1/products/{product_id}?expand=user", None),
+    ("get", "/api/v1/products/mairie/{mairie_id}", None),
+    ("get", "/api/v1/products/mairie/{mairie_id}?expand=association_user", None),
+    ("get", "/api/v1/products/mairie/{mairie_id}/export?with_names=true", None),
+    ("get", "/api/v1/products/association/{association_id}", None),
+    ("get", "/api/v1/products/user/{user_id}", None),
+    ("get", "/api/v1/format/get_pdf/{product_reference}", None),
+    (
+        "post",
+        "/api/v1/format/generate_pdf/?mairie_id={mairie_id}&association_id={association_id}"
+        "&product_reference={product_reference}",
+        None,
+    ),
+    ("post", "/api/v1/format/generate_pdf/batch", {"product_references": ["{product_reference}"], "output": "pdf"}),
+    ("post", "/api/v1/format/generate_pdf/batch", {"mairie_id": "{mairie_id}", "output": "pdf"}),
+]
+
+
+@pytest.mark.parametrize("method,url,payload", ROUTES, ids=[f"{method} {url}" for method, url, _ in ROUTES])
+def test_route_queries_use_indexes(test_client, seeded_db, captured_selects, method, url, payload):
+    ids = {key: str(value) for key, value in seeded_db.items()}
+    kwargs = {} if payload is None else {"json": {key: _fill(value, ids) for key, value in payload.items()}}
+    response = getattr(test_client, method)(url.format(**ids), **kwargs)
+    assert response.status_code < 500
+
+    product_queries = [query for query in captured_selects if re.search(r"\bproduct\b", query[1])]
+    assert product_queries, "the route issued no product query"
+
+    with engine.connect() as connection:
+        for driver, statement, parameters in product_queries:
+            statement, parameters = _to_psycopg(driver, statement, parameters)
+            plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+            assert "product" not in _seq_scanned_relations(plan[0]["Plan"]), (
+                f"sequential scan on product for:\n{statement}\n{json.dumps(plan, indent=2)}"
+            )
@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy import event
+
+from core.config import settings
+from db import database
+from db.database import get_read_db
+from main import app
+from tests.conftest import DATABASE_URL, engine
+
+# Second DSN on the test instance, standing in for a read-only replica
+REPLICA_URL = f"{DATABASE_URL}?application_name=pcc-replica"
+
+
+@pytest.fixture()
+def record_statements():
+    """Return a function recording the statements sent by an engine, until the end of the test."""
+    listeners = []
+
+    def record(target_engine):
+        statements = []
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(target_engine, "before_cursor_execute", capture)
+        listeners.append((target_engine, capture))
+        return statements
+
+    yield record
+    for target_engine, capture in listeners:
+        event.remove(target_engine, "before_cursor_execute", capture)
+
+
+@pytest.fixture()
+def read_routing(test_client, monkeypatch):
+    """
+    Serve get_read_db from database.read_engine again (conftest routes it to the primary session),
+    the primary being the test database. Returns a function building read_engine from the settings.
+    """
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.delitem(app.dependency_overrides, get_read_db)
+    created = []
+
+    def route_reads(replica_url):
+        monkeypatch.setattr(settings, "POSTGRES_REPLICA_URL", replica_url)
+        read_engine = database.create_read_engine()
+        monkeypatch.setattr(database, "read_engine", read_engine)
+        created.append(read_engine)
+        return read_engine
+
+    yield route_reads
+    for read_engine in created:
+        if read_engine is not engine:
+            read_engine.dispose()
+
+
+def test_reads_use_replica_when_configured(test_client, read_routing, record_statements, mairie_user_id, product_payload):
+    replica = read_routing(REPLICA_URL)
+    assert replica is not engine
+    replica_statements = record_statements(replica)
+    primary_statements = record_statements(engine)
+
+    response = test_client.post("/api/v1/products/", json=product_payload)
+    assert response.status_code == 201
+    assert replica_statements == []
+
+    primary_statements.clear()
+    response = test_client.get(f"/api/v1/products/mairie/{mairie_user_id}")
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert any(statement.lstrip().startswith("SELECT") for statement in replica_statements)
+    assert primary_statements == []
+
+
+def test_reads_use_primary_without_replica(test_client, read_routing, record_statements, mairie_user_id, product_payload):
+    read_engine = read_routing(None)
+    assert read_engine is engine
+    primary_statements = record_statements(engine)
+
+    test_client.post("/api/v1/products/", json=product_payload)
+    primary_statements.clear()
+    response = test_client.get(f"/api/v1/products/mairie/{mairie_user_id}")
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert any(statement.lstrip().startswith("SELECT") for statement in primary_statements)
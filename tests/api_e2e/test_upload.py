@@ -0,0 +1,136 @@
+import base64
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from PIL import Image
+
+from core.config import settings
+
+
+def test_upload_image_streams_to_storage(test_client, storage_client):
+    content = b"\x89PNG" + b"0" * (settings.UPLOAD_PART_SIZE + 1024)
+    response = test_client.post(
+        "/api/v1/upload/upload/img",
+        files={"file": ("../../photo.png", io.BytesIO(content), "image/png")},
+    )
+    assert response.status_code == 200
+    assert response.json()["filename"].endswith(f"/{settings.S3_BUCKET}/photo.png")
+
+    stored = storage_client.get_object(settings.S3_BUCKET, "photo.png")
+    assert stored.read() == content
+
+
+def test_upload_image_too_large(test_client, storage_client, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_MAX_SIZE", 1024)
+    response = test_client.post(
+        "/api/v1/upload/upload/img",
+        files={"file": ("big.png", io.BytesIO(b"0" * 2048), "image/png")},
+    )
+    assert response.status_code == 413
+
+
+def test_presigned_upload_attached_to_product(test_client, storage_client, product_payload):
+    response = test_client.post("/api/v1/products/", json=product_payload)
+    product_id = response.json()["product"]["id"]
+
+    response = test_client.post("/api/v1/upload/presign", json={"filename": "photo.png", "content_type": "image/png"})
+    assert response.status_code == 200
+    presigned = response.json()
+
+    # The client posts the signed form and the bytes straight to object storage
+    upload = httpx.post(presigned["url"], data=presigned["fields"], files={"file": ("photo.png", b"\x89PNG-direct", "image/png")})
+    assert upload.is_success
+
+    response = test_client.post(f"/api/v1/products/{product_id}/photos", json={"object_keys": [presigned["object_key"]]})
+    assert response.status_code == 200
+    photo_url = f"{settings.S3_ENDPOINT}/{settings.S3_BUCKET}/{presigned['object_key']}"
+    assert response.json()["photos"] == [photo_url]
+    # These bytes are not an image: no variant can be generated, so none is advertised
+    assert response.json()["thumbnails"] == [photo_url]
+
+    response = test_client.post(f"/api/v1/products/{product_id}/photos", json={"object_keys": ["products/missing.png"]})
+    assert response.status_code == 400
+
+
+def test_presigned_upload_policy_enforces_limits(test_client, storage_client):
+    response = test_client.post("/api/v1/upload/presign", json={"filename": "notes.txt", "content_type": "text/plain"})
+    assert response.status_code == 400
+
+    presigned = test_client.post("/api/v1/upload/presign", json={"filename": "photo.png"}).json()
+    conditions = json.loads(base64.b64decode(presigned["fields"]["policy"]))["conditions"]
+    assert ["eq", "$key", presigned["object_key"]] in conditions
+    assert ["starts-with", "$Content-Type", "image/"] in conditions
+    assert ["content-length-range", 1, settings.UPLOAD_MAX_SIZE] in conditions
+
+
+def test_attach_rejects_objects_outside_upload_limits(test_client, storage_client, product_payload, monkeypatch):
+    product_id = test_client.post("/api/v1/products/", json=product_payload).json()["product"]["id"]
+    storage_client.put_object(settings.S3_BUCKET, "products/notes.txt", io.BytesIO(b"text"), 4, content_type="text/plain")
+    storage_client.put_object(settings.S3_BUCKET, "products/big.png", io.BytesIO(b"0" * 2048), 2048, content_type="image/png")
+    monkeypatch.setattr(settings, "UPLOAD_MAX_SIZE", 1024)
+
+    for object_key in ("products/notes.txt", "products/big.png"):
+        response = test_client.post(f"/api/v1/products/{product_id}/photos", json={"object_keys": [object_key]})
+        assert response.status_code == 400
+    assert test_client.get(f"/api/v1/products/{product_id}").json()["photos"] == []
+
+
+def test_concurrent_attaches_keep_every_photo(test_client, storage_client, product_payload, monkeypatch):
+    product_id = test_client.post("/api/v1/products/", json=product_payload).json()["product"]["id"]
+    object_keys = ["products/first.png", "products/second.png"]
+    for object_key in object_keys:
+        storage_client.put_object(settings.S3_BUCKET, object_key, io.BytesIO(b"\x89PNG"), 4, content_type="image/png")
+
+    # Both requests are held inside the storage check until the other one has reached it
+    barrier = threading.Barrier(len(object_keys), timeout=10)
+    stat_object = storage_client.stat_object
+
+    def stat_object_in_step(*args, **kwargs):
+        barrier.wait()
+        return stat_object(*args, **kwargs)
+
+    monkeypatch.setattr(storage_client, "stat_object", stat_object_in_step)
+
+    def attach(object_key):
+        return test_client.post(f"/api/v1/products/{product_id}/photos", json={"object_keys": [object_key]})
+
+    with ThreadPoolExecutor(len(object_keys)) as pool:
+        assert all(response.status_code == 200 for response in pool.map(attach, object_keys))
+
+    photos = test_client.get(f"/api/v1/products/{product_id}").json()["photos"]
+    assert sorted(photos) == sorted(f"{settings.S3_ENDPOINT}/{settings.S3_BUCKET}/{key}" for key in object_keys)
+
+
+def test_attached_photo_variants_advertised_once_generated(test_client, storage_client, product_payload):
+    image = io.BytesIO()
+    Image.new("RGB", (1200, 800), "red").save(image, format="PNG")
+    response = test_client.post(
+        "/api/v1/upload/upload/img",
+        files={"file": ("derivatives.png", io.BytesIO(image.getvalue()), "image/png")},
+    )
+    assert response.status_code == 200
+    photo_url = response.json()["filename"]
+
+    response = test_client.post("/api/v1/products/", json={**product_payload, "photos": [photo_url]})
+    product_id = response.json()["product"]["id"]
+
+    # Variants are produced in the background once the photo belongs to a product
+    deadline = time.monotonic() + 10
+    while True:
+        product = test_client.get(f"/api/v1/products/{product_id}").json()
+        if product["thumbnails"] != [photo_url]:
+            break
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+    assert product["thumbnails"] == [f"{photo_url}.thumb.webp"]
+    assert product["photos_webp"] == [f"{photo_url}.webp"]
+    assert "photo_derivatives" not in product
+
+    thumbnail = storage_client.get_object(settings.S3_BUCKET, "derivatives.png.thumb.webp").read()
+    with Image.open(io.BytesIO(thumbnail)) as thumb:
+        assert thumb.format == "WEBP"
+        assert max(thumb.size) == settings.IMAGE_THUMBNAIL_SIZE
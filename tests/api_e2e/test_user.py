@@ -1,4 +1,18 @@
+import json
+import threading
+import uuid
+
+import bcrypt
+
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from core import security
+from core.config import settings
+from core.security import get_password_hash
+from crud import crud_user
+from crud.crud_user import get_user_by_email, get_user_by_id
 from main import app
 
 
@@ -44,3 +58,197 @@ def test_already_used_email_error(test_client, user_particulier_payload):
 #     response = test_client.post("/api/v1/users/token", json='{ username:  {}, password: {}}'.format(user_particulier_payload["email"], user_particulier_payload["password"]))
 #     response_json = response.json()
 #     assert response.status_code == 200
+
+
+def test_login_returns_tokens(test_client, user_particulier_payload):
+    response = test_client.post("/api/v1/users/", json=user_particulier_payload)
+    assert response.status_code == 201
+
+    response = test_client.post("/api/v1/users/token", data={
+        "username": user_particulier_payload["email"],
+        "password": user_particulier_payload["password"],
+    })
+    assert response.status_code == 200
+    response_json = response.json()
+    assert response_json["token_type"] == "bearer"
+    assert response_json["access_token"]
+
+    response = test_client.post("/api/v1/users/token", data={
+        "username": user_particulier_payload["email"],
+        "password": "wrongpassword",
+    })
+    assert response.status_code == 401
+
+
+def test_user_conditional_get(test_client, user_particulier_payload):
+    user = test_client.post("/api/v1/users/", json=user_particulier_payload).json()
+
+    response = test_client.get(f"/api/v1/users/{user['id']}")
+    assert response.status_code == 200
+    response = test_client.get(f"/api/v1/users/{user['id']}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    etag = test_client.get("/api/v1/users/").headers["ETag"]
+    assert test_client.get("/api/v1/users/", headers={"If-None-Match": etag}).status_code == 304
+    test_client.post("/api/v1/users/", json={**user_particulier_payload, "email": "another-" + user_particulier_payload["email"]})
+    assert test_client.get("/api/v1/users/", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_users_cursor_pagination_and_ndjson(test_client, user_particulier_payload, mairie_user_id):
+    created_ids = {mairie_user_id}
+    for index in range(3):
+        payload = {**user_particulier_payload, "email": f"page-{index}-{user_particulier_payload['email']}"}
+        created_ids.add(test_client.post("/api/v1/users/", json=payload).json()["id"])
+
+    seen_ids = []
+    response = test_client.get("/api/v1/users/", params={"limit": 2})
+    while True:
+        assert response.status_code == 200
+        seen_ids.extend(user["id"] for user in response.json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if next_cursor is None:
+            break
+        response = test_client.get("/api/v1/users/", params={"limit": 2, "cursor": next_cursor})
+    assert len(seen_ids) == len(set(seen_ids))
+    assert created_ids <= set(seen_ids)
+
+    response = test_client.get("/api/v1/users/", params={"format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    streamed = [json.loads(line) for line in response.text.splitlines()]
+    assert {user["id"] for user in streamed} == set(seen_ids)
+    assert all("password" not in user for user in streamed)
+
+    response = test_client.get("/api/v1/users/mairies", params={"format": "ndjson"})
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [mairie_user_id]
+    response = test_client.get("/api/v1/users/mairies")
+    assert [user["id"] for user in response.json()] == [mairie_user_id]
+    assert "password" not in response.json()[0]
+
+
+@pytest.mark.parametrize("route", ["/api/v1/users/", "/api/v1/users/mairies", "/api/v1/users/associations"])
+@pytest.mark.parametrize("params", [
+    {"limit": settings.PAGE_MAX_SIZE + 1},
+    {"limit": 0},
+    {"limit": -1},
+    {"skip": -1},
+])
+def test_user_list_rejects_out_of_range_paging(test_client, route, params):
+    assert test_client.get(route, params=params).status_code == 422
+
+
+@pytest.fixture()
+def user_caches():
+    """Start from empty user caches and return them."""
+    caches = (crud_user._users_by_id, crud_user._users_by_email)
+    for cache in caches:
+        cache.clear()
+    yield caches
+    for cache in caches:
+        cache.clear()
+
+
+def login(test_client, email, password):
+    return test_client.post("/api/v1/users/token", data={"username": email, "password": password})
+
+
+def test_user_conditional_get_ignores_stale_cache(test_client, db_session, user_caches, user_particulier_payload):
+    user = test_client.post("/api/v1/users/", json=user_particulier_payload).json()
+    etag = test_client.get(f"/api/v1/users/{user['id']}").headers["ETag"]
+    assert get_user_by_id(db_session, uuid.UUID(user["id"])) is not None
+
+    # Modification by another worker: this worker's cache is not invalidated
+    db_session.execute(
+        text('UPDATE "user" SET prenom = \'direct\', updated_at = now() WHERE id = :id'),
+        {"id": user["id"]},
+    )
+    db_session.commit()
+
+    response = test_client.get(f"/api/v1/users/{user['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["prenom"] == "direct"
+    response = test_client.get(f"/api/v1/users/{user['id']}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+def test_user_cache_hit_miss_and_invalidation(test_client, db_session, user_caches, user_particulier_payload):
+    by_id, by_email = user_caches
+    user_id = uuid.UUID(test_client.post("/api/v1/users/", json=user_particulier_payload).json()["id"])
+    # Creating a user never leaves a cached entry behind
+    assert by_id.get(user_id) is None
+
+    misses = by_id.stats()["misses"]
+    user = get_user_by_id(db_session, user_id)
+    assert by_id.stats()["misses"] == misses + 1
+    assert user.password is None
+
+    hits = by_id.stats()["hits"]
+    assert get_user_by_id(db_session, user_id) is user
+    assert by_id.stats()["hits"] == hits + 1
+    assert get_user_by_email(db_session, user_particulier_payload["email"].upper()) is user
+
+    # A hit does not go to the database
+    db_session.execute(text('UPDATE "user" SET prenom = \'direct\' WHERE id = :id'), {"id": user_id})
+    db_session.commit()
+    assert get_user_by_id(db_session, user_id).prenom == user_particulier_payload["prenom"]
+
+    token = login(test_client, user_particulier_payload["email"], user_particulier_payload["password"]).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    response = test_client.put("/api/v1/users/me", json={"prenom": "updated"}, headers=headers)
+    assert response.status_code == 200
+    assert by_id.get(user_id) is None
+    assert by_email.get(user_particulier_payload["email"]) is None
+    assert get_user_by_id(db_session, user_id).prenom == "updated"
+
+    response = test_client.delete("/api/v1/users/me", headers=headers)
+    assert response.status_code == 200
+    assert by_id.get(user_id) is None
+    assert get_user_by_id(db_session, user_id).deleted_at is not None
+
+
+def test_login_bypasses_user_cache(test_client, db_session, user_caches, user_particulier_payload):
+    email, password = user_particulier_payload["email"], user_particulier_payload["password"]
+    test_client.post("/api/v1/users/", json=user_particulier_payload)
+    assert login(test_client, email, password).status_code == 200
+    get_user_by_email(db_session, email)
+
+    # Password changed by another worker: this worker's cache was not invalidated
+    db_session.execute(
+        text('UPDATE "user" SET password = :password WHERE email = :email'),
+        {"password": get_password_hash("new-password*"), "email": email.lower()},
+    )
+    db_session.commit()
+    assert get_user_by_email(db_session, email) is not None
+
+    assert login(test_client, email, password).status_code == 401
+    assert login(test_client, email, "new-password*").status_code == 200
+
+
+def test_login_rejected_when_hashing_pool_is_full(test_client, user_particulier_payload, monkeypatch):
+    test_client.post("/api/v1/users/", json=user_particulier_payload)
+    # No free slot: every bcrypt operation is already running or queued
+    monkeypatch.setattr(security, "_hash_slots", threading.BoundedSemaphore(0))
+
+    response = login(test_client, user_particulier_payload["email"], user_particulier_payload["password"])
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_login_upgrades_outdated_password_hash(test_client, db_session, user_particulier_payload):
+    email, password = user_particulier_payload["email"], user_particulier_payload["password"]
+    test_client.post("/api/v1/users/", json=user_particulier_payload)
+    # Hash stored with a lower cost than the configured one
+    outdated_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=4)).decode("utf-8")
+    db_session.execute(
+        text('UPDATE "user" SET password = :password WHERE email = :email'),
+        {"password": outdated_hash, "email": email.lower()},
+    )
+    db_session.commit()
+
+    assert login(test_client, email, password).status_code == 200
+    stored_hash = db_session.execute(text('SELECT password FROM "user" WHERE email = :email'), {"email": email.lower()}).scalar()
+    assert stored_hash != outdated_hash
+    assert stored_hash.startswith(f"$2b${settings.BCRYPT_ROUNDS:02d}$")
+    assert login(test_client, email, password).status_code == 200
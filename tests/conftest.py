@@ -3,12 +3,24 @@ import uuid
 import pytest
 from dotenv import load_dotenv
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
 from faker import Faker
+from minio import Minio
+from moto.server import ThreadedMotoServer
 
 from main import app
-from db.database import get_db
+from db.database import get_async_db, get_db, get_engine, get_read_db
+from db.migrations import run_migrations
+from core.config import settings
+from core.storage import get_storage_client
+
+# Tests drive the certificate queue explicitly (see test_formatting.py)
+settings.CERTIFICATE_JOBS_IN_API = False
 
 #Chargement des variables d'environnement
 load_dotenv()
@@ -24,12 +36,15 @@ fake = Faker("fr_FR")
 
 #URL de connexion à la base de données
 DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
 #Création de la connexion à la base de données
 engine = create_engine(DATABASE_URL, echo=True)
+# Each TestClient runs its own event loop, so asyncpg connections must not be pooled across tests
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=True, poolclass=NullPool)
 
 # Create a sessionmaker to manage sessions
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = sessionmaker(class_=Session, autocommit=False, autoflush=False, bind=engine)
 
 # Create tables in the database
 SQLModel.metadata.create_all(bind=engine)
@@ -37,23 +52,23 @@ SQLModel.metadata.create_all(bind=engine)
 
 def create_db():
     SQLModel.metadata.create_all(engine)
-#Création de la base de données
-def get_db():
-    with Session(engine) as session:
-        yield session
-
+    run_migrations(engine)
 create_db()
 
 @pytest.fixture(scope="function")
 def db_session():
-    """Create a new database session with a rollback at the end of the test."""
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+    """
+    Create a new database session and truncate every table at the end of the test.
+
+    Data is really committed so that it is visible to both the sync session and the
+    async (asyncpg) session used by the `async def` routes.
+    """
+    session = TestingSessionLocal()
     yield session
     session.close()
-    transaction.rollback()
-    connection.close()
+    tables = ", ".join(f'"{table.name}"' for table in SQLModel.metadata.sorted_tables)
+    with engine.begin() as connection:
+        connection.execute(text(f"TRUNCATE {tables} CASCADE"))
 
 @pytest.fixture(scope="function")
 def test_client(db_session):
@@ -65,7 +80,14 @@ def test_client(db_session):
         finally:
             db_session.close()
 
+    async def override_get_async_db():
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield session
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_engine] = lambda: engine
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as test_client:
         yield test_client
 
@@ -102,3 +124,73 @@ def user_particulier_payload_updated(user_id):
         "role": "particulier", 
     }
 
+
+@pytest.fixture()
+def user_mairie_payload():
+    """Generate a mairie user payload."""
+    return {
+        "nom": fake.city(),
+        "prenom": "mairie",
+        "email": fake.email(),
+        "telephone": "0146000000",
+        "role": "mairie",
+        "password": "testpassword*"
+    }
+
+
+@pytest.fixture()
+def mairie_user_id(test_client, user_mairie_payload):
+    """Create a mairie user and return its id."""
+    response = test_client.post("/api/v1/users/", json=user_mairie_payload)
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+@pytest.fixture()
+def association_user_id(test_client):
+    """Create an association user and return its id."""
+    response = test_client.post("/api/v1/users/", json={
+        "nom": "Association",
+        "prenom": fake.company(),
+        "email": fake.email(),
+        "telephone": "0146000001",
+        "role": "association",
+        "password": "testpassword*"
+    })
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+@pytest.fixture()
+def product_payload(mairie_user_id):
+    """Generate a product payload attached to a mairie."""
+    return {
+        "title": "Ordinateur portable",
+        "description": fake.sentence(),
+        "productIssue": "Écran fissuré",
+        "marque": "Lenovo",
+        "status": "requete de dons",
+        "mairie_user_id": mairie_user_id,
+        "photos": [],
+    }
+
+
+@pytest.fixture(scope="session")
+def s3_server():
+    """Start a local S3-compatible server (moto) standing in for MinIO."""
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture()
+def storage_client(s3_server):
+    """Route the API object storage client to the local S3 stand-in."""
+    host, port = s3_server.get_host_and_port()
+    client = Minio(f"{host}:{port}", access_key="testing", secret_key="testing", secure=False, region="us-east-1")
+    if not client.bucket_exists(settings.S3_BUCKET):
+        client.make_bucket(settings.S3_BUCKET)
+    app.dependency_overrides[get_storage_client] = lambda: client
+    yield client
+    app.dependency_overrides.pop(get_storage_client, None)
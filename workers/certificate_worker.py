@@ -0,0 +1,128 @@
+"""
+Worker de la file de génération des certificats.
+
+Usage : python -m workers.certificate_worker [--processes N]
+
+Déployé comme service à part (`certificate-worker` dans docker-compose.yml). Sans worker dédié,
+l'API peut traiter elle-même la file (voir `drain_jobs` et `CERTIFICATE_JOBS_IN_API`).
+
+Chaque processus réserve les jobs en attente dans la table `certificatejob`
+(SELECT ... FOR UPDATE SKIP LOCKED), génère le PDF et enregistre le résultat.
+Les workers doivent partager `CERTIFICATE_DIR` avec l'API, qui sert les fichiers via /format/get_pdf.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from core.certificate import CertificateFields, render_certificate, shutdown_render_pool
+from core.config import settings
+from crud.crud_job import claim_next_job, complete_job, fail_job, update_job_progress
+from models.models import User
+
+logger = logging.getLogger(__name__)
+
+
+def certificate_path(product_reference: str) -> str:
+    return os.path.join(settings.CERTIFICATE_DIR, f"{product_reference}.pdf")
+
+
+def process_next_job(engine: Engine) -> bool:
+    """
+    Traite un job de la file. Retourne False si aucun job n'était disponible.
+    """
+    with Session(engine) as db:
+        job = claim_next_job(db)
+        if job is None:
+            return False
+
+        try:
+            mairie_user = db.get(User, job.mairie_user_id)
+            association_user = db.get(User, job.association_user_id)
+            pdf = render_certificate(CertificateFields(
+                mairie_nom=mairie_user.nom,
+                association_nom=association_user.nom,
+                association_prenom=association_user.prenom,
+                product_reference=job.product_reference,
+                date=job.created_at.strftime('%d-%m-%Y'),
+            ))
+            update_job_progress(db, job, 70)
+
+            pdf_path = certificate_path(job.product_reference)
+            os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+            tmp_path = f"{pdf_path}.{job.id}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(pdf)
+            os.replace(tmp_path, pdf_path)
+
+            complete_job(db, job, pdf_path)
+        except Exception as e:
+            logger.exception("Échec du job de certificat %s", job.id)
+            fail_job(db, job, str(e))
+        return True
+
+
+async def drain_jobs(engine: Engine):
+    """
+    Traite la file en tâche de fond de l'API. Le rendu s'exécute dans un thread pour ne pas
+    bloquer la boucle d'évènements ; SKIP LOCKED permet de cohabiter avec d'autres workers.
+    """
+    while True:
+        try:
+            processed = await asyncio.to_thread(process_next_job, engine)
+        except Exception:
+            # Base indisponible par exemple : la tâche ne doit pas s'arrêter pour autant
+            logger.exception("Échec du traitement de la file des certificats")
+            processed = False
+        if not processed:
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+
+
+def run_worker():
+    """Boucle d'un processus worker : traite les jobs tant qu'il y en a, puis attend."""
+    # Import tardif : chaque processus crée ses propres connexions après le fork
+    from db.database import engine
+
+    while True:
+        try:
+            processed = process_next_job(engine)
+        except Exception:
+            # Base pas encore prête ou connexion perdue : le processus continue d'interroger la file
+            logger.exception("Échec du traitement de la file des certificats")
+            processed = False
+        if not processed:
+            time.sleep(settings.JOB_POLL_INTERVAL)
+
+
+def start_worker_process() -> multiprocessing.Process:
+    process = multiprocessing.Process(target=run_worker, daemon=True)
+    process.start()
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de génération des certificats PDF")
+    parser.add_argument("--processes", type=int, default=settings.CERTIFICATE_WORKERS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    processes = [start_worker_process() for _ in range(args.processes)]
+    try:
+        # Supervision : un processus arrêté (erreur non rattrapée, OOM...) est relancé
+        while True:
+            for index, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning("Processus worker %s arrêté (code %s), relancé", process.pid, process.exitcode)
+                    processes[index] = start_worker_process()
+            time.sleep(settings.JOB_POLL_INTERVAL)
+    finally:
+        shutdown_render_pool()
+
+
+if __name__ == "__main__":
+    main()